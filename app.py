@@ -1,18 +1,40 @@
 """
 Main starting script for the application
 """
+from importlib import import_module
 from pathlib import Path
 
 from shiny import App, ui, render, reactive
-from modules import user_selection_module, home_screen_module, edit_habits_module, habit_analytics_module
 from services.database import setup_database
-from services.state import state
+from services.state import SessionState
+from config import DB_PROFILE
+
+# sets up the database from services/database.py and reports the active performance profile
+db_settings = setup_database()
+print(f"[DB] profile '{DB_PROFILE}': " + ", ".join(f"{k}={v}" for k, v in db_settings.items()))
+
+# module of every page, a module (and the libraries it needs, e.g. pandas or matplotlib)
+# is only imported when a session navigates to its page for the first time
+PAGE_MODULES = {
+    "user_selection": "modules.user_selection_module",
+    "home_screen": "modules.home_screen_module",
+    "edit_habits": "modules.edit_habits_module",
+    "analyze_habits": "modules.habit_analytics_module",
+}
+
+
+def page_module(page):
+    """
+    returns the module of a page, it is imported on the first call and taken from sys.modules afterwards
+
+    Parameters:
+    - page: string, name of the page (key of PAGE_MODULES)
+    """
+    return import_module(PAGE_MODULES[page])
 
-# sets up the database from services/database.py
-setup_database()
 
 dir = Path.cwd().resolve() # current working directory
-static_path = dir.joinpath("static") # folder with images and the stylesheet
+static_path = dir.joinpath("static") # folder with images, scripts and the stylesheet
 
 
 app_ui = ui.page_fluid(
@@ -26,6 +48,9 @@ app_ui = ui.page_fluid(
             href="https://fonts.googleapis.com/css2?family=Open+Sans&display=swap" # google open sans font
         ),
         ui.tags.link(rel="icon", type="image/png", href="images/fav_lifestyle.png"),
+        ui.tags.script(src="https://cdn.jsdelivr.net/npm/chart.js@4.4.4/dist/chart.umd.js"), # chart library for the streaks plot
+        ui.tags.script(src="js/streaks_chart.js"), # draws the streaks plot in the browser
+        ui.tags.script(src="js/user_picker.js"), # reports the user tile which was clicked
         ui.include_css("static/styles.css") # css styles in /static
     ),
     ui.output_ui("main_ui"),
@@ -35,6 +60,7 @@ app_ui = ui.page_fluid(
 
 def server(input, output, session):
 
+    state = SessionState() # reactive values of this session only
     initialized_modules = set()
     _last_page = reactive.Value(None)
 
@@ -44,16 +70,16 @@ def server(input, output, session):
         """
         handles the rendering of the page the user currently is
         """
-        page = state()["current_page"]
+        page = state.get("current_page")
 
         if page == "user_selection":
-            return user_selection_module.user_selection_ui()
+            return page_module(page).user_selection_ui()
         elif page == "home_screen":
-            return home_screen_module.home_screen_ui()
+            return page_module(page).home_screen_ui()
         elif page == "edit_habits":
-            return edit_habits_module.edit_habits_ui()
+            return page_module(page).edit_habits_ui()
         elif page == "analyze_habits":
-            return habit_analytics_module.habit_analytics_ui()
+            return page_module(page).habit_analytics_ui()
 
 
     @reactive.effect
@@ -61,7 +87,7 @@ def server(input, output, session):
         """
         Mount the server() of the page the user navigated to
         """
-        page = state()["current_page"]
+        page = state.get("current_page")
         
         # only react when the current page actually changes, just to reduce reactivity
         if _last_page.get() == page:
@@ -71,13 +97,13 @@ def server(input, output, session):
         # mount server functions only once
         if page not in initialized_modules:
             if page == "user_selection":
-                user_selection_module.user_selection_server(input, output, session)
+                page_module(page).user_selection_server(input, output, session, state)
             elif page == "home_screen":
-                home_screen_module.home_screen_server(input, output, session)
+                page_module(page).home_screen_server(input, output, session, state)
             elif page == "edit_habits":
-                edit_habits_module.edit_habits_server(input, output, session)
+                page_module(page).edit_habits_server(input, output, session, state)
             elif page == "analyze_habits":
-                habit_analytics_module.habit_analytics_server(input, output, session)
+                page_module(page).habit_analytics_server(input, output, session, state)
             initialized_modules.add(page)
 
 
@@ -1,3 +1,62 @@
 from pathlib import Path
+import os
 
 DB_PATH = Path(__file__).parent / "services" / "habittracker.db"
+
+# connection pool of the database layer
+DB_POOL_SIZE = 8 # maximum number of long-lived connections (one per thread)
+DB_STATEMENT_CACHE_SIZE = 128 # prepared statements kept per connection
+DB_MIGRATION_CHUNK_SIZE = 50_000 # rows per transaction when a migration backfills data
+
+# habit id lists of 'habitID IN (...)' queries (services/database.py, _id_lists)
+# a list is padded to the next of these sizes, so only a few statement texts are prepared and cached,
+# longer lists are queried in chunks of the largest size (sqlite allows 999 variables in older versions)
+DB_ID_LIST_SIZES = (1, 8, 64, 512)
+DB_ID_TEMP_TABLE_THRESHOLD = 4096 # from this many ids on, they are joined from a temporary table instead
+
+# cached streak and analytics results (services/cache.py), least recently used entries are evicted first
+RESULT_CACHE_SIZE = 256
+
+# users per page of the user selection screen
+USER_PAGE_SIZE = 24
+
+# habits per page of the habit table on the edit screen
+HABIT_PAGE_SIZE = 10
+
+# rows per chunk of the streamed exports on the analytics screen
+EXPORT_CHUNK_SIZE = 5000
+
+# streaks plot of the analytics screen (models/streak_plot.py)
+PLOT_CACHE_SIZE = 32 # rendered images kept in memory
+PLOT_WORKERS = 2 # threads which render the images off the event loop
+PLOT_JITTER_SEED = 7 # seed of the jitter, so the same data always gives the same image
+
+# where the streaks plot is drawn, e.g. HABITTRACKER_PLOT_RENDERER=server
+# - client: the browser draws the chart (static/js/streaks_chart.js) from a compact json series
+# - server: matplotlib renders an image, it is also used when the chart library can't be loaded in the browser
+PLOT_RENDERER = os.environ.get("HABITTRACKER_PLOT_RENDERER", "client")
+
+# named sqlite performance profiles, the pragmas are applied to every connection the database layer hands out
+# - performance: WAL lets readers continue while a check is written, synchronous NORMAL is safe in WAL mode
+# - safe: the sqlite defaults (rollback journal, full fsync on every commit)
+DB_PROFILES = {
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024, # bytes
+        "cache_size": -64 * 1024, # negative values are KiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000, # milliseconds
+    },
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+}
+
+# the profile can be switched without code changes, e.g. HABITTRACKER_DB_PROFILE=safe
+DB_PROFILE = os.environ.get("HABITTRACKER_DB_PROFILE", "performance")
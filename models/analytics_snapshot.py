@@ -0,0 +1,261 @@
+"""
+Script handles the analytics snapshot of one user
+All habits, their periods, record streaks and check aggregates are loaded once,
+the plot and every download of the analytics screen derive their data from it
+The check days themselves are only loaded when the plot or the streak history needs them
+"""
+import pandas as pd
+from services.database import get_user_habit_data, get_habits
+from services.cache import cached_for_user
+from models.habit import Habit
+
+
+class AnalyticsSnapshot:
+    def __init__(self, user_id, habits, aggregates=None, checks=None):
+        self.user_id = user_id
+        self.habits = habits # list of habit dictionaries (Habit.to_dict), active habits first
+        self.aggregates = aggregates or {} # dict, key: habit_id, value: check_count, active_days, first_check, last_check
+        self.records = {} # dict, key: habit_id, value: highest streak ever
+        self._checks = checks
+
+    @property
+    def checks(self):
+        """
+        dict, key: habit_id, value: int array of the check days
+        loaded on first use, the tables of the downloads only need the aggregates
+        """
+        if self._checks is None:
+            # one query for the check days of all habits of the user
+            rows = get_habits(self.user_id, columns=("habitID",), with_checks=True)
+            self._checks = {r["habitID"]: r["checks"] for r in rows}
+        return self._checks
+
+    @classmethod
+    def load(cls, user_id):
+        """
+        load the snapshot of one user from the database
+
+        Parameters:
+        - user_id: integer, ID of the current user
+        """
+        rows, aggregates = get_user_habit_data(user_id)
+
+        snapshot = cls(user_id, [Habit.from_row(r).to_dict() for r in rows], aggregates)
+        snapshot.records = {r["habitID"]: int(r["BestStreak"] or 0) for r in rows}
+        return snapshot
+
+    @classmethod
+    def for_user(cls, user_id):
+        """
+        the snapshot of one user from the result cache, it is only loaded again after the user wrote something
+        the snapshot is shared between all sessions of the user, so it must not be modified
+
+        Parameters:
+        - user_id: integer, ID of the current user
+        """
+        return cached_for_user("analytics_snapshot", user_id, lambda: cls.load(user_id))
+
+    def active(self):
+        """
+        returns the active habits
+        """
+        return [h for h in self.habits if h["IsActive"] == 1]
+
+    def archived(self):
+        """
+        returns the archived habits
+        """
+        return [h for h in self.habits if h["IsActive"] == 0]
+
+    def periods(self, active_only=True):
+        """
+        returns the sorted, unique period labels the habits of the user use
+
+        Parameters:
+        - active_only: boolean, only look at the active habits
+        """
+        habits = self.active() if active_only else self.habits
+        return sorted({h["Periodtype"] for h in habits if h["Periodtype"] is not None})
+
+    def by_name(self, habit_name):
+        """
+        returns the first habit with this name or None
+
+        Parameters:
+        - habit_name: string, name of the habit
+        """
+        return next((h for h in self.habits if h["HabitName"] == habit_name), None)
+
+    def check_count(self, habit_id):
+        """
+        returns the number of days the habit was checked
+
+        Parameters:
+        - habit_id: integer, ID of the habit
+        """
+        aggregate = self.aggregates.get(habit_id)
+        return aggregate["active_days"] if aggregate else 0
+
+    def has_checks(self):
+        """
+        returns True when at least one habit of the user was checked
+        """
+        return bool(self.aggregates)
+
+    # ------------------ download tables -------------------
+    # one method per download of the analytics screen, they only work on the loaded data
+
+    def active_frame(self):
+        """
+        table of all active habits
+        """
+        df = pd.DataFrame(self.active())
+
+        if df.empty:
+            df = pd.DataFrame(columns=["habitID","HabitName","IsActive","DateCreated","LastChecked","Periodtype","EqualsToDays"])
+        return df
+
+    def periodicity_frame(self, period):
+        """
+        table of all habits (active + archived) with the selected period
+
+        Parameters:
+        - period: string, period label selected by the user
+        """
+        df = pd.DataFrame(self.habits) 
+        filtered_df = df[df["Periodtype"] == period] # filter df for the user input
+
+        if filtered_df is None or filtered_df.empty:
+            filtered_df = pd.DataFrame(columns=[
+                "habitID","userID","HabitName","periodtypeID","IsActive",
+                "DateCreated","LastChecked","Periodtype","EqualsToDays"
+            ])
+        return filtered_df
+
+    def archived_records_frame(self):
+        """
+        table of the archived habits and their record streaks
+        """
+        arch = self.archived()
+
+        if not arch:
+            return pd.DataFrame(columns=["habitID","HabitName","EqualsToDays","record_streak"])
+
+        rows = []
+        for a in arch:
+            hid = a["habitID"]
+            name = a.get("HabitName")
+            try:
+                equal_days = max(1, int(a.get("EqualsToDays") or 1))
+            except (TypeError, ValueError):
+                equal_days = 1
+
+            s = self.records.get(hid, 0) # stored streak state, no replay of the activities
+
+            rows.append({
+                "habitID": hid,
+                "HabitName": name,
+                "EqualsToDays": equal_days,
+                "record_streak": int(s or 0),
+            })
+
+        return pd.DataFrame(rows).sort_values(["HabitName","habitID"])
+
+    def completions_frame(self):
+        """
+        table of the number of checks per habit
+        """
+        if not self.habits:
+            return pd.DataFrame(columns=["habitID", "HabitName", "check_count", "first_check", "last_check"])
+
+        rows = []
+        for a in self.habits:
+            hid = a["habitID"]
+            aggregate = self.aggregates.get(hid, {})
+            rows.append({
+                "habitID": hid,
+                "HabitName": a.get("HabitName"),
+                "check_count": self.check_count(hid), # the number of days the habit was checked
+                "first_check": aggregate.get("first_check"),
+                "last_check": aggregate.get("last_check"),
+            })
+
+        return pd.DataFrame(rows).sort_values(["HabitName", "habitID"])
+
+    def longest_overall_frame(self):
+        """
+        table with the habit with the highest streak, active and archived habits included
+        """
+        if not self.habits:
+            return pd.DataFrame(columns=["habitID","HabitName","EqualsToDays","record_streak"])
+
+        rows = []
+        for a in self.habits:
+            hid = a["habitID"]
+            name = a.get("HabitName")
+            try:
+                equal_days = a.get("EqualsToDays") or 1
+            except (TypeError, ValueError):
+                equal_days = 1
+
+            # the highest streak for the current habit
+            s = self.records.get(hid, 0)
+
+            rows.append({
+                "habitID": hid,
+                "HabitName": name,
+                "EqualsToDays": equal_days,
+                "record_streak": int(s or 0),
+            })
+
+        df = pd.DataFrame(rows)
+        return df.sort_values(["record_streak", "HabitName", "habitID"],
+                              ascending=[False, True, True]).head(1)
+
+    def longest_for_habit_frame(self, habit_name):
+        """
+        table with the highest streak of the selected habit
+
+        Parameters:
+        - habit_name: string, name of the habit selected by the user
+        """
+        meta = self.by_name(habit_name) # reverse search from the selected habit name
+
+        if not meta:
+            return pd.DataFrame(columns=["habitID","HabitName","EqualsToDays","record_streak"])
+
+        hid = meta["habitID"]
+        equal_days = int(meta.get("EqualsToDays") or 1)
+
+        streak = int(self.records.get(hid, 0))
+
+        return pd.DataFrame([{
+            "habitID": hid,
+            "HabitName": habit_name,
+            "EqualsToDays": equal_days,
+            "record_streak": streak,
+        }])
+
+    def all_frames(self, period=None, habit_name=None):
+        """
+        all six download tables at once, e.g. for the zip bundle
+        returns a list of (file name, dataframe) with the same file names as the single downloads
+
+        Parameters:
+        - period: string, period for the periodicity table, defaults to the first period of the active habits
+        - habit_name: string, habit for the longest run table, defaults to the first habit in alphabetical order
+        """
+        periods = self.periods()
+        names = sorted(h["HabitName"] for h in self.habits)
+
+        period = period or (periods[0] if periods else None)
+        habit_name = habit_name or (names[0] if names else None)
+
+        return [
+            ("active_habits.csv", self.active_frame()),
+            ("habits_by_periodicity.csv", self.periodicity_frame(period)),
+            ("archived_with_record_streaks.csv", self.archived_records_frame()),
+            ("completions_per_habit.csv", self.completions_frame()),
+            ("longest_run_overall.csv", self.longest_overall_frame()),
+            ("longest_run_selected_habit.csv", self.longest_for_habit_frame(habit_name)),
+        ]
@@ -2,13 +2,17 @@
 Script handles the habit class with some pre-defined methods
 Methods mainly are wrapper for the database functions in database.py
 """
-from services.database import get_active_habits, get_habit, add_habit, edit_habit, delete_habit, get_archived_habits, mark_habit_as_checked, get_checks_for_habits
+from services.database import get_habits, get_habit, add_habit, edit_habit, delete_habit, mark_habit_as_checked, mark_habits_as_checked, get_streak_states
+from services.cache import cached_for_user
 from datetime import date, datetime, timedelta
+from numbers import Integral
+
+EPOCH = date(1970, 1, 1)
 
 
 class Habit:
     def __init__(self, habit_id, user_id, habit_name, periodtype_id, is_active = 1, 
-                 date_created = None, last_checked = None, period_label = None, equals_days = None):
+                 date_created = None, last_checked = None, period_label = None, equals_days = None, check_days = None):
         self.habit_id = habit_id
         self.user_id = user_id
         self.habit_name = habit_name
@@ -18,6 +22,7 @@ class Habit:
         self.last_checked = last_checked
         self.period_label = period_label
         self.equals_days = equals_days
+        self.check_days = check_days # int array of the check days, only when it was loaded with the habit
 
 
     @staticmethod
@@ -38,6 +43,7 @@ class Habit:
             last_checked=row.get("LastChecked"),
             period_label=row.get("Periodtype"),
             equals_days=row.get("EqualsToDays"),
+            check_days=row.get("checks"),
         )
 
     def to_dict(self):
@@ -57,41 +63,41 @@ class Habit:
         }
 
     @staticmethod
-    def full_list_by_user(user_id):
+    def full_list_by_user(user_id, with_checks=False):
         """
         get all habits from the current user
-        (active + archived ones)
+        (active + archived ones, the active ones first)
 
         Parameters:
         - user_id: integer, ID of the current user
+        - with_checks: boolean, loads the check days of every habit (check_days) with the same query
         """
-        rows = get_active_habits(user_id)
-        rows += get_archived_habits(user_id)
-        
+        rows = get_habits(user_id, with_checks=with_checks)
         return [Habit.from_row(r) for r in rows]
 
     @staticmethod
-    def list_by_user(user_id):
+    def list_by_user(user_id, with_checks=False):
         """
         get only active habits from the current user
-        identical to the function in the user class
-        the user class was mainly used on the home screen
+        the user class uses it as well (User.habits)
 
         Parameters:
         - user_id: integer, ID of the current user
+        - with_checks: boolean, loads the check days of every habit (check_days) with the same query
         """
-        rows = get_active_habits(user_id)
+        rows = get_habits(user_id, status="active", with_checks=with_checks)
         return [Habit.from_row(r) for r in rows]
 
     @staticmethod
-    def archived_list_by_user(user_id):
+    def archived_list_by_user(user_id, with_checks=False):
         """
         get all archived habits from the current user
 
         Parameters:
         - user_id: integer, ID of the current user
+        - with_checks: boolean, loads the check days of every habit (check_days) with the same query
         """
-        rows = get_archived_habits(user_id)
+        rows = get_habits(user_id, status="archived", with_checks=with_checks)
         return [Habit.from_row(r) for r in rows]
 
     @staticmethod
@@ -153,39 +159,75 @@ class Habit:
         mark the selected habit as checked and write the date to the database
         """
         mark_habit_as_checked(self.habit_id)
+
+    @staticmethod
+    def mark_checked_many(habit_ids, when=None):
+        """
+        mark several habits as checked in one database transaction
+        returns a list of (habit_id, error message) for the habits which could not be checked
+
+        Parameters:
+        - habit_ids: list, IDs of the selected habits
+        - when: datetime, time of the check, defaults to now
+        """
+        return mark_habits_as_checked(habit_ids, when=when)
       
     @classmethod
     def ongoing_streaks_by_user(cls, user_id):
         """
         calculate the current, ongoing streaks for one user
+        reads the streak state which is maintained on every check, the activities are not touched
+        the result is cached until the user writes something or the day changes
 
         Parameters:
         - user_id: integer, ID of the current user
         """
-        habits = get_active_habits(user_id)
+        today = date.today()
 
-        if not habits:
-            return {}
+        def compute():
+            habits = get_habits(user_id, status="active", columns=("habitID",))
 
-        habit_ids = [h["habitID"] for h in habits]
-        checks_map = get_checks_for_habits(habit_ids)
-        today = date.today()
+            if not habits:
+                return {}
 
-        out = {}
+            # a run which was broken by the elapsed time since the last check is not reset in the database,
+            # a later check dated in the past could still continue it, current_from_state reports it as 0
+            states = get_streak_states([h["habitID"] for h in habits])
 
-        for h in habits:
-            hid = h["habitID"]
+            return {hid: cls.current_from_state(s, today) for hid, s in states.items()}
+
+        return cached_for_user("ongoing_streaks", user_id, compute, today)
+
+    @staticmethod
+    def record_streaks(habit_ids):
+        """
+        get the highest ever streak of several habits from the stored streak state
+
+        Parameters:
+        - habit_ids: list, IDs of the habits
+        """
+        return {hid: int(s["BestStreak"]) for hid, s in get_streak_states(list(habit_ids)).items()}
+
+    @staticmethod
+    def current_from_state(streak_state, today):
+        """
+        the current streak of a habit from its stored streak state,
+        gives the same result as current_streak on all check dates
+
+        Parameters:
+        - streak_state: dict, row from get_streak_states
+        - today: date, the date of today
+        """
+        last = streak_state["LastCheckDay"]
+        if last is None:
+            return 0
 
-            days = int(h["EqualsToDays"])
-            checks = checks_map.get(hid, [])
-            streak = cls.current_streak(
-                check_dates=checks,
-                equal_days=days,        
-                today=today
-            )
-            out[hid] = streak
+        # the streak is 0 when the last check is too long ago, the same rule as in current_streak
+        days_since = (today - EPOCH).days - last
+        if days_since > int(streak_state["EqualsToDays"]) - 1:
+            return 0
 
-        return out
+        return int(streak_state["CurrentStreak"])
 
     @staticmethod
     def _to_date(d):
@@ -201,22 +243,49 @@ class Habit:
             return d
         return datetime.fromisoformat(str(d)).date()
 
+    @staticmethod
+    def _to_day(d):
+        """
+        helper function to return the day number (days since 1970-01-01) of a check,
+        the format of the ActivityDay column - the streak calculations work on these integers
+        
+        Parameters:
+        - d: string / date / integer, a check date or an already converted day number
+        """
+        if d is None:
+            return None
+        if isinstance(d, Integral):
+            return int(d)
+        return (Habit._to_date(d) - EPOCH).days
+
+    @staticmethod
+    def _from_day(n):
+        """
+        helper function to return the date of a day number
+
+        Parameters:
+        - n: integer, days since 1970-01-01
+        """
+        return EPOCH + timedelta(days=int(n))
+
     @staticmethod
     def current_streak(check_dates, equal_days, today):
         """
         calculate the current streak for a habit
 
         Parameters:
-        - check_dates: dict, key: habit_id, value: check dates for the habit
+        - check_dates: dict, key: habit_id, value: check dates (or day numbers) for the habit
         - equal_days: integer, the value in days for the habit
         - today: date, the date of today
         """
-        days = sorted([Habit._to_date(d) for d in check_dates if Habit._to_date(d) is not None])
+        days = sorted(n for n in map(Habit._to_day, check_dates) if n is not None)
         if not days:
             return 0
+
+        today = Habit._to_day(today)
         
         # if today - the last checked date is greater than the days of the habits period, the streak is 0
-        if (today - days[-1]).days > equal_days:
+        if today - days[-1] > equal_days:
             return 0
 
         streak = 0
@@ -232,12 +301,12 @@ class Habit:
             if i < 0:
                 break
 
-            window_start = end - timedelta(days=equal_days - 1)
+            window_start = end - (equal_days - 1)
             if days[i] < window_start:
                 break
             streak += 1
 
-            end = days[i] - timedelta(days=1)
+            end = days[i] - 1
             i -= 1
 
         return streak
@@ -252,34 +321,38 @@ class Habit:
         - check_dates: dict, key: habit_id, value: check dates for the habit
         - equal_days: integer, the value in days for the habit
         """
-        days = sorted({Habit._to_date(d) for d in check_dates if Habit._to_date(d) is not None})
-
-        if not days:
-            return 0
+        return Habit.highest_streak_run(check_dates, equal_days)[0]
 
-        best = 0
-        n = len(days)
+    @staticmethod
+    def highest_streak_run(check_dates, equal_days):
+        """
+        calculate the highest ever streak a habit had and when it happened
+        returns a tuple (streak, first check date of the run, last check date of the run),
+        the dates are None when there was no streak at all
 
-        # similar to the current streak algorithm, but goes through all checks to calculate the highest ever reached
-        for k in range(n):    
-            end = days[k]
-            cnt = 0
-            j = k
+        a run continues as long as the gap between two check days is not greater than the period days,
+        so one pass over the sorted check days is enough - the first run wins when two are equally long
 
-            while j >= 0:
-                window_start = end - timedelta(days=equal_days - 1)
+        Parameters:
+        - check_dates: dict, key: habit_id, value: check dates (or day numbers) for the habit
+        - equal_days: integer, the value in days for the habit
+        """
+        days = sorted({n for n in map(Habit._to_day, check_dates) if n is not None})
 
-                if days[j] < window_start:
-                    break
+        if not days or equal_days < 1:
+            return 0, None, None
 
-                cnt += 1
-                end = days[j] - timedelta(days=1)
-                j -= 1
+        best, best_start, best_end = 1, days[0], days[0]
+        count, start = 1, days[0]
 
-                while j >= 0 and days[j] > end:
-                    j -= 1
+        for prev, day in zip(days, days[1:]):
+            if day - prev <= equal_days:
+                count += 1
+            else:
+                # the gap was too long, a new run starts with this check
+                count, start = 1, day
 
-            if cnt > best:
-                best = cnt
+            if count > best:
+                best, best_start, best_end = count, start, day
 
-        return best
\ No newline at end of file
+        return best, Habit._from_day(best_start), Habit._from_day(best_end)
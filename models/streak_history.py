@@ -0,0 +1,298 @@
+"""
+Script handles the streak history of habits, e.g. for the plot on the analytics screen
+The daily streak series of a habit is computed in one pass over its sorted check days,
+which are handled as integer day numbers (days since 1970-01-01)
+Longer time spans are aggregated to weekly or monthly points, so the number of points of the plot stays bounded
+The series can also be encoded compactly for a chart drawn in the browser (run-length encoded streaks)
+"""
+import json
+from array import array
+from datetime import date, timedelta
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from models.habit import Habit
+
+HISTORY_COLUMNS = ["date", "habitID", "HabitName", "streak"]
+
+# selectable time spans of the plot, key: (label, days back from today or None for the whole history, bucket of one point)
+HISTORY_RANGES = {
+    "90d": ("90 days", 90, "day"),
+    "1y": ("1 year", 365, "week"),
+    "all": ("All time", None, "month"),
+}
+
+
+def day_numbers(check_dates):
+    """
+    returns the sorted, unique day numbers of a list of check dates as numpy array
+
+    Parameters:
+    - check_dates: list, check dates of one habit (strings, dates or day numbers)
+    """
+    # int arrays from get_checks_for_habits are converted without a python loop
+    if isinstance(check_dates, (array, np.ndarray)):
+        return np.unique(np.asarray(check_dates, dtype=np.int64))
+
+    days = [n for n in map(Habit._to_day, check_dates) if n is not None]
+    return np.unique(np.asarray(days, dtype=np.int64))
+
+
+def streak_series(check_dates, equal_days, start, end):
+    """
+    calculates the streak of a habit for every day from start to end (both included)
+    returns a tuple of two arrays: the days as datetime64[D] and the streak of each day
+
+    the streak of a day is the same value Habit.current_streak returns for it as 'today':
+    - the length of the run (gaps between checks not greater than equal_days) ending at the last check up to this day
+    - 0 when this last check is equal_days or more days ago, or when there is no check yet
+
+    Parameters:
+    - check_dates: list, check dates of the habit (strings, dates or day numbers)
+    - equal_days: integer, the value in days for the habit
+    - start: date / day number, first day of the series
+    - end: date / day number, last day of the series
+    """
+    days = day_numbers(check_dates)
+    start, end = Habit._to_day(start), Habit._to_day(end)
+    timeline = np.arange(start, end + 1, dtype=np.int64)
+
+    streaks = np.zeros(len(timeline), dtype=np.int32)
+    if not len(days) or not len(timeline) or equal_days < 1:
+        return timeline.astype("datetime64[D]"), streaks
+
+    # run length up to every check: a new run starts where the gap to the previous check is too long
+    idx = np.arange(len(days))
+    new_run = np.concatenate(([True], np.diff(days) > equal_days))
+    run_start = np.maximum.accumulate(np.where(new_run, idx, 0))
+    run_length = idx - run_start + 1
+
+    # last check on or before each day of the timeline
+    last = np.searchsorted(days, timeline, side="right") - 1
+    has_check = last >= 0
+    last = last.clip(min=0)
+    alive = has_check & (timeline - days[last] <= equal_days - 1)
+
+    streaks[alive] = run_length[last[alive]]
+    return timeline.astype("datetime64[D]"), streaks
+
+
+def history_span(range_key, today=None):
+    """
+    returns (since, bucket) of a time span in HISTORY_RANGES, since is None for the whole history
+
+    Parameters:
+    - range_key: string, key of HISTORY_RANGES (e.g. 1y)
+    - today: date, last day of the history, defaults to today
+    """
+    _, days, bucket = HISTORY_RANGES[range_key]
+    if days is None:
+        return None, bucket
+
+    today = today or date.today()
+    return today - timedelta(days=days - 1), bucket
+
+
+def _bucket_keys(days, bucket):
+    """
+    helper function, returns the number of the week / month of every day number
+
+    Parameters:
+    - days: int array, day numbers
+    - bucket: string, day, week or month
+    """
+    if bucket == "week":
+        return (days - 4) // 7 # weeks start on monday, day 4 (1970-01-05) was a monday
+    if bucket == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    if bucket == "day":
+        return days
+    raise ValueError(f"unknown bucket: {bucket}")
+
+
+def downsample(dates, streaks, bucket, how="max"):
+    """
+    aggregates a daily streak series to one point per week or month
+    every point is dated on the last day of its bucket within the series, so the last point is still the last day
+    returns a tuple of two arrays like streak_series
+
+    Parameters:
+    - dates: datetime64[D] array, consecutive days of the series
+    - streaks: int array, streak of each day
+    - bucket: string, day, week or month
+    - how: string, max (highest streak within the bucket) or last (streak on the last day of the bucket)
+    """
+    if bucket == "day" or not len(dates):
+        return dates, streaks
+
+    keys = _bucket_keys(dates.astype(np.int64), bucket)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys)) - 1
+
+    if how == "max":
+        values = np.maximum.reduceat(streaks, starts)
+    elif how == "last":
+        values = streaks[ends]
+    else:
+        raise ValueError(f"unknown aggregation: {how}")
+
+    return dates[ends], values.astype(np.int32)
+
+
+def habit_series(habits, checks_map, since=None, until=None, bucket="day", how="max"):
+    """
+    yields (habit, days as datetime64[D], streaks) for every habit with at least one check in the time span,
+    each series starts at the first check of the habit (or at since, whichever is later)
+
+    Parameters:
+    - habits: list, habit dictionaries with habitID, HabitName and EqualsToDays
+    - checks_map: dict, key: habit_id, value: check dates for the habit
+    - since: date, optional lower bound for the first day of the history
+    - until: date, last day of the history, defaults to today
+    - bucket: string, day, week or month, one point per bucket (see downsample)
+    - how: string, max or last, the streak of a week / month
+    """
+    until = Habit._to_day(until or date.today())
+    since = Habit._to_day(since)
+
+    for h in habits:
+        series = _habit_series(h, checks_map, since, until)
+        if series is not None:
+            yield (h,) + downsample(*series, bucket, how)
+
+
+def iter_streak_history(habits, checks_map, since=None, until=None):
+    """
+    yields the streak history of several habits habit by habit as lists of (date, habitID, HabitName, streak) rows,
+    the same rows as streak_history_df without building one dataframe for all habits (e.g. for streamed exports)
+
+    Parameters:
+    - habits: list, habit dictionaries with habitID, HabitName and EqualsToDays
+    - checks_map: dict, key: habit_id, value: check dates for the habit
+    - since: date, optional lower bound for the first day of the history
+    - until: date, last day of the history, defaults to today
+    """
+    for h, dates, streaks in habit_series(habits, checks_map, since, until):
+        yield list(zip(dates.astype(str).tolist(), repeat(h["habitID"]), repeat(h["HabitName"]), streaks.tolist()))
+
+
+def _habit_series(habit, checks_map, since, until):
+    """
+    helper function, returns the streak series of one habit from its first check (or since) to until,
+    None when the habit has no check in this time span
+
+    Parameters:
+    - habit: dict, habit dictionary with habitID and EqualsToDays
+    - checks_map: dict, key: habit_id, value: check dates for the habit
+    - since: integer, day number of the optional lower bound
+    - until: integer, day number of the last day
+    """
+    days = day_numbers(checks_map.get(habit["habitID"], []))
+
+    # never was checked, doesnt need to cluster the legend
+    if not len(days):
+        return None
+
+    start = int(days[0]) if since is None else max(int(days[0]), since)
+    if start > until:
+        return None
+
+    try:
+        equal_days = int(habit.get("EqualsToDays") or 1)
+    except (TypeError, ValueError):
+        equal_days = 1
+
+    return streak_series(days, equal_days, start, until)
+
+
+def streak_history_df(habits, checks_map, since=None, until=None, bucket="day", how="max"):
+    """
+    creates the streak history of several habits as one dataframe with the columns date, habitID, HabitName and streak
+    every habit starts at its first check (or at since, whichever is later), habits without checks are left out
+
+    Parameters:
+    - habits: list, habit dictionaries with habitID, HabitName and EqualsToDays
+    - checks_map: dict, key: habit_id, value: check dates for the habit
+    - since: date, optional lower bound for the first day of the history
+    - until: date, last day of the history, defaults to today
+    - bucket: string, day, week or month, one row per bucket (see downsample)
+    - how: string, max or last, the streak of a week / month
+    """
+    frames = []
+    for h, dates, streaks in habit_series(habits, checks_map, since, until, bucket, how):
+        frames.append(pd.DataFrame({
+            "date": dates.astype("datetime64[ns]"),
+            "habitID": h["habitID"],
+            "HabitName": h["HabitName"],
+            "streak": streaks.astype(int),
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    return pd.concat(frames, ignore_index=True).sort_values(["HabitName", "date"], kind="stable")
+
+
+def run_lengths(values):
+    """
+    run-length encodes a series, returns a list of [value, count] pairs
+    the streak of a habit stays flat between its checks, so the pairs are much shorter than the series
+
+    Parameters:
+    - values: array / list of integers
+    """
+    values = np.asarray(values)
+    if not len(values):
+        return []
+
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    counts = np.diff(np.append(starts, len(values)))
+    return [[int(v), int(n)] for v, n in zip(values[starts], counts)]
+
+
+def expand_runs(runs):
+    """
+    reverses run_lengths, returns the series as int array
+
+    Parameters:
+    - runs: list, [value, count] pairs
+    """
+    if not runs:
+        return np.zeros(0, dtype=np.int32)
+
+    values, counts = zip(*runs)
+    return np.repeat(np.asarray(values, dtype=np.int32), counts)
+
+
+def streak_chart_json(habits, checks_map, since=None, until=None, bucket="day", how="max"):
+    """
+    returns the streak history of several habits as compact json for the chart in the browser (static/js/streaks_chart.js)
+    every habit is sent as its first day (day number) and the run-length encoded streaks of the following points,
+    the days themselves are not sent, they follow from the first day and the counts
+    weekly / monthly points also get the run-length encoded gaps in days between them (daily points are one day apart)
+
+    {"habits": [{"id": 1, "name": "Read", "start": 20100, "runs": [[1, 1], [2, 1], [0, 4]]}, ...]}
+
+    Parameters:
+    - habits: list, habit dictionaries with habitID, HabitName and EqualsToDays
+    - checks_map: dict, key: habit_id, value: check dates for the habit
+    - since: date, optional lower bound for the first day of the history
+    - until: date, last day of the history, defaults to today
+    - bucket: string, day, week or month, one point per bucket (see downsample)
+    - how: string, max or last, the streak of a week / month
+    """
+    series = []
+    for h, dates, streaks in sorted(habit_series(habits, checks_map, since, until, bucket, how), key=lambda s: s[0]["HabitName"]):
+        days = dates.astype(np.int64)
+        entry = {
+            "id": h["habitID"],
+            "name": h["HabitName"],
+            "start": int(days[0]),
+            "runs": run_lengths(streaks),
+        }
+        if bucket != "day":
+            entry["gaps"] = run_lengths(np.diff(days))
+        series.append(entry)
+
+    # "</" is escaped, so a habit name can't close the script tag the json is embedded in
+    return json.dumps({"habits": series}, separators=(",", ":")).replace("</", "<\\/")
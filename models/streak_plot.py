@@ -0,0 +1,145 @@
+"""
+Script handles the streaks plot of the analytics screen
+The figure is drawn without pyplot (no global state), so it can be rendered in a worker thread
+and never blocks the event loop of the app. Rendered images are cached by a hash of the plotted data
+and the size of the figure, the same data always gives the same image (seeded jitter)
+"""
+import asyncio
+import base64
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib import ticker
+from matplotlib.ticker import MaxNLocator
+import matplotlib.dates as mdates
+
+from config import PLOT_CACHE_SIZE, PLOT_WORKERS, PLOT_JITTER_SEED
+from services.cache import ResultCache
+
+BASE_DPI = 96 # pixels per inch of the browser, the same value shiny uses for render.plot
+
+images = ResultCache(max_size=PLOT_CACHE_SIZE) # key: hash of data and size, value: png as data uri
+_executor = ThreadPoolExecutor(max_workers=PLOT_WORKERS, thread_name_prefix="streaks-plot")
+
+
+def plot_key(df, width, height, pixelratio):
+    """
+    returns a hash of everything the image depends on
+
+    Parameters:
+    - df: dataframe, streak history with the columns date, habitID, HabitName and streak
+    - width: integer, width of the image in css pixels
+    - height: integer, height of the image in css pixels
+    - pixelratio: float, device pixel ratio of the browser
+    """
+    digest = hashlib.sha1(f"{int(width)}x{int(height)}@{float(pixelratio)}".encode())
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def draw_streaks(df, width, height, pixelratio):
+    """
+    draws the streak history as line plot and returns the figure
+
+    Parameters:
+    - df: dataframe, streak history with the columns date, habitID, HabitName and streak
+    - width: integer, width of the image in css pixels
+    - height: integer, height of the image in css pixels
+    - pixelratio: float, device pixel ratio of the browser
+    """
+    fig = Figure(figsize=(width / BASE_DPI, height / BASE_DPI), dpi=BASE_DPI * pixelratio)
+    ax = fig.subplots()
+
+    if df.empty:
+        ax.text(0.5, 0.5, "No streak data yet", ha="center", va="center")
+        ax.axis("off")
+        return fig
+
+    df = df.copy()
+
+    df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+    df = df.sort_values(["HabitName", "date"])
+
+    # the number of dates is already bounded by the time span of the history (daily, weekly or monthly points)
+    habits = df["HabitName"].unique()
+
+    # points with the same streak on the same day are overlapping
+    # jitter moves the points a little bit away from the correct point,
+    # it is seeded per habit so the same data always gives the same image
+    jitter_amount = 0.15
+    for name in habits:
+        g = df[df["HabitName"] == name]
+        rng = np.random.default_rng([PLOT_JITTER_SEED, int(g["habitID"].iloc[0])])
+        jitter = rng.uniform(-jitter_amount, jitter_amount, size=len(g))
+        ax.plot(g["date"], g["streak"] + jitter, marker="o", label=name, linestyle='-')
+
+    # x-axis limits, with only one existing habit, on its first day it leads to errors
+    xmin = df["date"].min()
+    xmax = df["date"].max()
+    if xmin == xmax:
+        pad = pd.Timedelta(days=3)
+        ax.set_xlim(xmin - pad, xmax + pad)
+    else:
+        ax.set_xlim(xmin, xmax)
+
+    max_streak = int(df["streak"].max())
+    upper = max_streak + 3  # upper limit for the y-axis
+    ax.set_ylim(0, max(upper, 1))
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+    # X-axis: adaptive locator/formatter to avoid too many ticks
+    locator = mdates.AutoDateLocator(minticks=4, maxticks=8)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    ax.xaxis.set_minor_locator(ticker.NullLocator())
+    fig.autofmt_xdate(rotation=0)
+
+    ax.legend(loc="best")
+    ax.grid(True, axis="y", linestyle=":", linewidth=0.8)
+
+    return fig
+
+
+def streaks_png(df, width, height, pixelratio, key=None):
+    """
+    returns the streaks plot as png data uri, from the cache when the same image was rendered before
+
+    Parameters:
+    - df: dataframe, streak history with the columns date, habitID, HabitName and streak
+    - width: integer, width of the image in css pixels
+    - height: integer, height of the image in css pixels
+    - pixelratio: float, device pixel ratio of the browser
+    - key: string, plot_key of the arguments when it is already known
+    """
+    def render():
+        buffer = io.BytesIO()
+        draw_streaks(df, width, height, pixelratio).savefig(buffer, format="png")
+        return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    return images.get_or_compute(key or plot_key(df, width, height, pixelratio), render)
+
+
+async def streaks_png_async(df, width, height, pixelratio):
+    """
+    returns the streaks plot as png data uri, a cached image is returned right away,
+    a new one is rendered in the worker threads, so the event loop can handle other sessions meanwhile
+
+    Parameters:
+    - df: dataframe, streak history with the columns date, habitID, HabitName and streak
+    - width: integer, width of the image in css pixels
+    - height: integer, height of the image in css pixels
+    - pixelratio: float, device pixel ratio of the browser
+    """
+    key = plot_key(df, width, height, pixelratio)
+
+    cached = images.get(key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, streaks_png, df, width, height, pixelratio, key)
@@ -3,7 +3,7 @@ Script handles the user class with some pre-defined methods
 Methods mainly are wrapper for the database functions in database.py
 """
 
-from services.database import get_users, new_user, delete_user, get_active_habits
+from services.database import get_users, get_user, get_users_page, new_user, delete_user
 from models.habit import Habit
 
 class User:
@@ -16,8 +16,7 @@ class User:
         """
         get active habits from the current user
         """
-        rows = get_active_habits(self.user_id) or []
-        return [Habit.from_row(r) for r in rows]
+        return Habit.list_by_user(self.user_id)
 
     @classmethod
     def get_all(cls):
@@ -26,6 +25,28 @@ class User:
         """
         return [cls(user_id, username) for (user_id, username) in get_users()]
 
+    @classmethod
+    def get(cls, user_id):
+        """
+        get one user by its ID, None when it doesn't exist
+        """
+        row = get_user(user_id)
+        return cls(row["userID"], row["Username"]) if row else None
+
+    @classmethod
+    def page(cls, search="", after=None, limit=24):
+        """
+        get one page of users sorted by name, see get_users_page in database.py
+        """
+        return [cls(user_id, username) for (user_id, username) in get_users_page(search, after, limit)]
+
+    @property
+    def page_key(self):
+        """
+        position of the user in the sorted user list, the next page starts after it
+        """
+        return (self.username, self.user_id)
+
     @classmethod
     def create(cls, username):
         """
@@ -3,11 +3,20 @@ Module creates the page after the login
 The home screen
 """
 from shiny import render, ui, reactive
-from services.state import state, update_state
-import pandas as pd
 from models.habit import Habit
+from services.cache import cached_for_user
+from services.database import get_habits_page, HABIT_SORT_COLUMNS, STANDARD_PERIODS
+from config import HABIT_PAGE_SIZE
 import re
 
+SORT_LABELS = {
+    "created": "Created at",
+    "name": "Habit Name",
+    "period": "Period",
+    "status": "Status",
+    "last_checked": "Last Checked",
+}
+
 
 def edit_habits_ui():
     return ui.page_fluid(
@@ -16,8 +25,23 @@ def edit_habits_ui():
             ui.card(
                 {"class": "edit-habits-table"},
                 ui.h4("Your Habits"),
-                # table on the left of the UI
-                ui.output_data_frame("habit_table")
+                # filters and sort order of the table, they are applied in the database
+                ui.layout_columns(
+                    ui.input_text("habit_filter_name", None, placeholder="Filter by name"),
+                    ui.input_select("habit_filter_period", None, choices=["All periods", *STANDARD_PERIODS, "Custom"]),
+                    ui.input_select("habit_filter_status", None, choices=["All", "Active", "Archived"]),
+                    ui.input_select("habit_sort", None, choices={key: f"Sort: {SORT_LABELS[key]}" for key in HABIT_SORT_COLUMNS}, selected="created"),
+                    ui.input_checkbox("habit_sort_desc", "Descending"),
+                    col_widths=(4, 2, 2, 2, 2),
+                ),
+                # table on the left of the UI, it only shows one page of the habits
+                ui.output_data_frame("habit_table"),
+                ui.div(
+                    {"class": "habit-pager"},
+                    ui.input_action_button("habits_prev", "Previous", disabled=True),
+                    ui.output_text("habit_page_info", inline=True),
+                    ui.input_action_button("habits_next", "Next", disabled=True)
+                )
             ),
             ui.card(
                 # form on the right side
@@ -68,55 +92,91 @@ def edit_habits_ui():
     )
 
 
-def edit_habits_server(input, output, session):
+def edit_habits_server(input, output, session, state):
 
     selected_habit_id = reactive.Value(None)
-    _refresh_table = reactive.Value(0) # this variable is to trigger re-render / recalculate table e.g. after deletion
+    page = reactive.Value(0) # index of the shown page of the habit table
 
-    def habits_raw_df():
+
+    @reactive.Calc
+    def _table_query():
         """
-        creates the 'raw' dataframe, this is because for display reasons the column names 
-        needs to be renamed, for queries etc. the original dataframe remains useful
+        the filters and the sort order of the habit table selected by the user
         """
-        user = state()["current_user"]
-        _ = _refresh_table() # creates dependency, this variable is to trigger re-render / recalculate
+        period = input.habit_filter_period()
+        status = input.habit_filter_status()
+
+        return {
+            "search": input.habit_filter_name().strip(),
+            "period": None if period == "All periods" else period,
+            "is_active": {"Active": 1, "Archived": 0}.get(status),
+            "sort": input.habit_sort() if input.habit_sort() in HABIT_SORT_COLUMNS else "created",
+            "descending": bool(input.habit_sort_desc()),
+        }
 
-        cols = ["habitID","HabitName","Periodtype","IsActive", "DateCreated", "LastChecked"]
+
+    @reactive.effect
+    @reactive.event(_table_query, ignore_init=True)
+    def _reset_page():
+        """
+        other filters or another sort order start at the first page
+        """
+        page.set(0)
+
+
+    @reactive.Calc
+    def habit_page():
+        """
+        loads the habits of the shown page (filtered and sorted in the database)
+        returns a tuple: the habit rows of the page and the number of habits matching the filters
+
+        the page is taken from the result cache, it is only loaded again after the user wrote something
+        """
+        user = state.get("current_user")
+        _ = state.get("refresh_data") # creates dependency, this variable is to trigger re-render / recalculate e.g. after deletion
 
         if user is None:
-            return pd.DataFrame(columns=cols)
+            return [], 0
 
-        # get all habits from current user, including archived
-        rows = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
-        
-        if not rows:
-            return pd.DataFrame(columns=cols)
+        query = _table_query()
+        offset = page.get() * HABIT_PAGE_SIZE
+
+        def compute():
+            return get_habits_page(user.user_id, offset=offset, limit=HABIT_PAGE_SIZE, **query)
 
-        return pd.DataFrame(rows)[cols]
+        return cached_for_user("habit_page", user.user_id, compute, *query.values(), offset, HABIT_PAGE_SIZE)
+
+
+    @reactive.effect
+    def _clamp_page():
+        """
+        after the last habit of the last page was deleted, the page before is shown
+        """
+        rows, _ = habit_page()
+        if not rows and page.get() > 0:
+            page.set(page.get() - 1)
 
 
     @reactive.Calc
     def habits_df():
         """
-        creates the dataframe for the display, with renamed columns
-        builds on the raw dataframe
+        creates the dataframe for the display of the shown page, with renamed columns
         """
-        raw = habits_raw_df().copy()
+        import pandas as pd # imported on first use, it is not needed for the app startup
 
-        if raw.empty:
-            return pd.DataFrame(columns=["Habit Name","Period","Status", "Created at","Last Checked"])
+        rows, _ = habit_page()
+        cols = ["Habit Name","Period","Status", "Created at","Last Checked"]
 
-        raw["IsActive"] = raw["IsActive"].map({1: "Active", 0: "Archived"})
-
-        raw.rename(columns={
-            "HabitName": "Habit Name",
-            "Periodtype": "Period",
-            "IsActive": "Status",
-            "DateCreated": "Created at",
-            "LastChecked": "Last Checked",
-        }, inplace=True)
+        if not rows:
+            return pd.DataFrame(columns=cols)
 
-        return raw[["Habit Name","Period","Status","Created at","Last Checked"]]
+        return pd.DataFrame({
+            "Habit Name": [r["HabitName"] for r in rows],
+            "Period": [r["Periodtype"] for r in rows],
+            "Status": ["Active" if r["IsActive"] == 1 else "Archived" for r in rows],
+            "Created at": [r["DateCreated"] for r in rows],
+            "Last Checked": [r["LastChecked"] for r in rows],
+        }, columns=cols)
 
 
     @output
@@ -132,6 +192,48 @@ def edit_habits_server(input, output, session):
             )
 
 
+    @output
+    @render.text
+    def habit_page_info():
+        """
+        shows the number of the page and the number of pages
+        """
+        _, total = habit_page()
+        pages = max(1, -(-total // HABIT_PAGE_SIZE))
+        return f"Page {page.get() + 1} of {pages} ({total} habits)"
+
+
+    @reactive.effect
+    def toggle_pager():
+        """
+        the buttons to page through the habits are only clickable when there is a previous / next page
+        """
+        _, total = habit_page()
+        ui.update_action_button("habits_prev", disabled=page.get() == 0)
+        ui.update_action_button("habits_next", disabled=(page.get() + 1) * HABIT_PAGE_SIZE >= total)
+
+
+    @reactive.effect
+    @reactive.event(input.habits_next)
+    def _next_page():
+        """
+        show the next page of the habit table
+        """
+        _, total = habit_page()
+        if (page.get() + 1) * HABIT_PAGE_SIZE < total:
+            page.set(page.get() + 1)
+
+
+    @reactive.effect
+    @reactive.event(input.habits_prev)
+    def _previous_page():
+        """
+        show the page before
+        """
+        if page.get() > 0:
+            page.set(page.get() - 1)
+
+
     def reset_form():
         """
         this is just a safety method to reset the form
@@ -148,34 +250,36 @@ def edit_habits_server(input, output, session):
     def _on_select_row():
         """
         handles the user click on one of the habits
+        the clicked row is looked up in the rows of the shown page, nothing is loaded again
+        the page is read isolated: paging or filtering must not apply the old row index to the rows of the new page,
+        the table is rendered again then and reports its cleared selection itself
         """
         sel = input.habit_table_selected_rows()
-        df_disp = habits_df()
-        df_raw  = habits_raw_df()
+        with reactive.isolate():
+            rows, _ = habit_page()
 
-        if not sel or df_disp.empty:
+        if not sel or not rows:
             reset_form()
             return
 
         idx = sel[0]
 
         # reset the index, this is because after habit deletion it throws sometimes an index error
-        if idx is None or idx < 0 or idx >= len(df_disp) or idx >= len(df_raw):
+        if idx is None or idx < 0 or idx >= len(rows):
             reset_form()
             return
 
-        hid = int(df_raw.iloc[idx]["habitID"])
-        selected_habit_id.set(hid)
+        row = rows[idx]
+        selected_habit_id.set(int(row["habitID"]))
 
         # load the data from the clicked row from the table into the form
-        row = df_disp.iloc[idx]
-        ui.update_text("habit_name", value=row["Habit Name"])
-        ui.update_select("habit_status", selected=row["Status"])
+        ui.update_text("habit_name", value=row["HabitName"])
+        ui.update_select("habit_status", selected="Active" if row["IsActive"] == 1 else "Archived")
 
-        label = row.get("Period")
+        label = row["Periodtype"]
 
         # handles custom - period habits
-        if label not in ("Daily", "Weekly", "Monthly", "Yearly"):
+        if label not in STANDARD_PERIODS:
             match = re.search(r"\b\d+\b", label)
             ui.update_select("habit_period", selected="Custom")
             ui.update_text("habit_custom", value=match.group())
@@ -190,7 +294,7 @@ def edit_habits_server(input, output, session):
         handles what happens when the user clicks on the 'Save Changes' button
         it creates either a new habit in the database or updates an existing one
         """
-        user = state()["current_user"]
+        user = state.get("current_user")
         name = input.habit_name().strip()
 
         if not name:
@@ -228,7 +332,7 @@ def edit_habits_server(input, output, session):
                 ui.notification_show(f"Could not update habit: {e}", type="error")
                 return
             
-        _refresh_table.set(_refresh_table() + 1)
+        state.bump("refresh_data")
         selected_habit_id.set(None)
         ui.notification_show("Saved.", type="message")
 
@@ -278,7 +382,7 @@ def edit_habits_server(input, output, session):
                 ui.notification_show(f"Delete failed: {e}", type="error")
                 return
 
-        _refresh_table.set(_refresh_table() + 1)
+        state.bump("refresh_data")
         reset_form()
         selected_habit_id.set(None)
         ui.modal_remove()
@@ -321,12 +425,12 @@ def edit_habits_server(input, output, session):
 
         This leads to the deletion of the user inside the database
         """
-        user = state()["current_user"]
+        user = state.get("current_user")
         if hasattr(user, "delete"):
             user.delete()
         ui.modal_remove()
-        update_state(current_page="user_selection",
-             refresh_user=state()["refresh_user"] + 1)
+        state.bump("refresh_user")
+        state.update_state(current_page="user_selection")
 
 
     @reactive.Effect
@@ -345,5 +449,5 @@ def edit_habits_server(input, output, session):
         """
         handles the button click to go back to the home screen
         """
-        update_state(current_page="home_screen")
+        state.update_state(current_page="home_screen")
 
@@ -3,16 +3,16 @@ Module creates the Analyze Habits Screen
 after the user clicks the button on the home screen
 """
 from shiny import render, ui, reactive, req
-from services.state import state, update_state
-from models.habit import Habit
-from services.database import get_checks_for_habits
+from models.analytics_snapshot import AnalyticsSnapshot
+from models.streak_history import streak_history_df, iter_streak_history, habit_series, streak_chart_json, history_span, HISTORY_COLUMNS, HISTORY_RANGES
+from services.cache import cached_for_user
+from services.database import iter_activity_log, ACTIVITY_LOG_COLUMNS
+from services.export import csv_chunks, zip_chunks, columnar_available, activities_parquet, habits_parquet, streak_history_parquet, COLUMNAR_DATASETS
+from config import EXPORT_CHUNK_SIZE, PLOT_RENDERER
 import pandas as pd
-import numpy as np
-from datetime import date, timedelta
-import matplotlib.pyplot as plt
-from matplotlib import ticker
-from matplotlib.ticker import MaxNLocator
-import matplotlib.dates as mdates
+from datetime import date
+
+DEFAULT_RANGE = "90d" # time span of the plot until the user selects another one (key of HISTORY_RANGES)
 
 
 def habit_analytics_ui():
@@ -22,7 +22,12 @@ def habit_analytics_ui():
             ui.card(
                 {"class": "analytics-plot"},
                 ui.h4("Streaks over time (active habits)"),
-                ui.output_plot("streaks_plot")
+                ui.input_radio_buttons(
+                    "streaks_range", None,
+                    choices={key: label for key, (label, _, _) in HISTORY_RANGES.items()},
+                    selected=DEFAULT_RANGE, inline=True
+                ),
+                ui.output_ui("streaks_plot", class_="shiny-report-size", style="width:100%;height:400px;")
             ),
 
             # buttons on the right side
@@ -39,6 +44,10 @@ def habit_analytics_ui():
                 ui.output_ui("completions_button"),
                 ui.output_ui("longest_overall_button"),
                 ui.output_ui("longest_habit_button"),
+                ui.output_ui("activity_log_button"),
+                ui.output_ui("streak_history_button"),
+                ui.output_ui("parquet_button"),
+                ui.output_ui("bundle_button"),
                 ui.br(),
                 ui.input_action_button("analytics_home", "Back to the home screen")
             )
@@ -46,159 +55,126 @@ def habit_analytics_ui():
     )
 
 
-def habit_analytics_server(input, output, session):
+def habit_analytics_server(input, output, session, state):
+
+    def _current_user():
+        """
+        returns the current user and creates a dependency on the user and on writes of the user,
+        so the plot and the buttons are updated after habits were checked or edited
+        """
+        _ = state.get("refresh_data")
+        return state.get("current_user")
+
+
+    @reactive.Calc
+    def _snapshot():
+        """
+        loads the habits, periods, record streaks and check days of the current user once,
+        all renderers and downloads below derive their data from this snapshot
+        it is only reloaded when the user changes or writes (refresh_data)
+        """
+        user = _current_user()
+        return AnalyticsSnapshot.for_user(user.user_id)
+
+
+    def _plot_range():
+        """
+        returns the time span of the plot selected by the user (key of HISTORY_RANGES)
+        """
+        if "streaks_range" in input and input.streaks_range() in HISTORY_RANGES:
+            return input.streaks_range()
+        return DEFAULT_RANGE
+
 
     @reactive.Calc
     def _streak_history_df():
         """
         calculates the streak history for the plot for all active habits
 
-        returns a dictionary for every habit with the streak for each day,
+        returns a dataframe with the streak of every habit for each point of the selected time span,
         this needs to be done this way to ensure a line
-        - to reduce the amount of calculations the MAX_DAYS variable can be set and it won't calculate any further from today
-        - uses the current streak algorithm from the Habit class
+        - 90 days are shown day by day, the longer spans are aggregated to the highest streak per week / month,
+          so the number of points stays bounded for years of history (HISTORY_RANGES in models/streak_history.py)
+        - uses the vectorized streak history from models/streak_history.py
         """
-        user = state()["current_user"] 
-        rows = [h.to_dict() for h in Habit.list_by_user(user.user_id)]
+        user = _current_user()
+        today = date.today()
+        plot_range = _plot_range()
 
-        if not rows:
-            return pd.DataFrame(columns=["date", "habitID", "HabitName", "streak"])
+        def compute():
+            snapshot = AnalyticsSnapshot.for_user(user.user_id)
+            rows = snapshot.active()
+
+            if not rows:
+                return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+            since, bucket = history_span(plot_range, today)
+            return streak_history_df(rows, snapshot.checks, since=since, until=today, bucket=bucket)
 
+        # the history only changes with a write of the user or on the next day
+        return cached_for_user("streak_history", user.user_id, compute, today, plot_range)
+
+
+    @reactive.Calc
+    def _streak_chart_json():
+        """
+        the streak history of all active habits as compact json for the chart in the browser,
+        the same points as _streak_history_df, but without building a dataframe
+        """
+        user = _current_user()
         today = date.today()
-        MAX_DAYS = 180 # the maximum days to go back for the plot
+        plot_range = _plot_range()
 
-        habit_ids = [r["habitID"] for r in rows]
-        checks_map = get_checks_for_habits(habit_ids) 
+        def compute():
+            snapshot = AnalyticsSnapshot.for_user(user.user_id)
+            since, bucket = history_span(plot_range, today)
+            return streak_chart_json(snapshot.active(), snapshot.checks, since=since, until=today, bucket=bucket)
 
-        out = []
-    
-        for r in rows:
-            hid = r["habitID"]
-            name = r["HabitName"]
-
-            try:
-                equal_days = int(r.get("EqualsToDays") or 1)
-            except (TypeError, ValueError):
-                equal_days = 1
-
-            created = Habit._to_date(r.get("DateCreated"))
-            checks = checks_map.get(hid, [])
-                
-            days = sorted({Habit._to_date(d) for d in checks if Habit._to_date(d) is not None})
-
-            # never was checked, doesnt need to cluster the legend
-            if not days:
-                continue
-            # first check date
-            elif days:
-                start_date = days[0]
-            # or creation date
-            elif created:
-                start_date = created
-            else:
-                start_date = today
-            
-            # exclude checks too far in the past
-            min_start = today - timedelta(days=MAX_DAYS - 1)
-
-            if start_date < min_start:
-                start_date = min_start
-
-            # create a daterange to go through
-            date_range = pd.date_range(start=start_date, end=today, freq="D")
-
-            for d in date_range:
-                # calculate the streak for each day
-                s = Habit.current_streak(
-                    check_dates=days,
-                    equal_days=equal_days,
-                    today=d.date()
-                )
-                out.append({
-                    "date": pd.to_datetime(d.date()),
-                    "habitID": hid,
-                    "HabitName": name,
-                    "streak": int(s)
-                })
-
-        if not out:
-            return pd.DataFrame(columns=["date", "habitID", "HabitName", "streak"])
-
-        df = pd.DataFrame(out).sort_values(["HabitName", "date"])
-        return df
+        return cached_for_user("streak_chart", user.user_id, compute, today, plot_range)
+
+
+    def _client_chart():
+        """
+        returns True when the browser draws the plot,
+        the browser reports streaks_chart_unavailable when it couldn't load the chart library
+        """
+        if PLOT_RENDERER != "client":
+            return False
+        return not ("streaks_chart_unavailable" in input and input.streaks_chart_unavailable())
 
 
     @output
-    @render.plot
-    def streaks_plot():
+    @render.ui
+    async def streaks_plot():
         """
         sets up the plot on the left side of the UI
-        """
-        df = _streak_history_df()
-        if df.empty:
-            fig, ax = plt.subplots()
-            ax.text(0.5, 0.5, "No streak data yet", ha="center", va="center")
-            ax.axis("off")
-            return fig
-
-        df = df.copy()
-
-        df["date"] = pd.to_datetime(df["date"]).dt.normalize() 
-        df = df.sort_values(["HabitName", "date"])
-
-        n_dates = df["date"].nunique()
-
-        # calculations to have some benchmarks for the axis sizes, depending on the number of checks / streak
-        if n_dates <= 20:
-            k = n_dates                  
-        elif n_dates <= 60:
-            k = 30                    
-        elif n_dates <= 150:
-            k = 60                       
-        else:
-            k = 90                  
-
-        last_unique = np.sort(df["date"].unique())[-k:]
-        df = df[df["date"].isin(last_unique)]
-
-        # Plot
-        fig, ax = plt.subplots()
-
-        habits = df["HabitName"].unique()
-
-        # points with the same streak on the same day are overlapping
-        # jitter moves the points a little bit away from the correct point
-        jitter_amount = 0.15
-        for _, name in enumerate(habits):
-            g = df[df["HabitName"] == name]
-            jitter = np.random.uniform(-jitter_amount, jitter_amount, size=len(g))
-            ax.plot(g["date"], g["streak"] + jitter, marker="o", label=name, linestyle='-')
-
-        # x-axis limits, with only one existing habit, on its first day it leads to errors
-        xmin = df["date"].min()
-        xmax = df["date"].max()
-        if xmin == xmax:
-            pad = pd.Timedelta(days=3)
-            ax.set_xlim(xmin - pad, xmax + pad)
-        else:
-            ax.set_xlim(xmin, xmax)
+        - client: only the json series is sent, static/js/streaks_chart.js draws the chart
+        - server: the image is rendered in a worker thread and cached by its data and size (models/streak_plot.py)
+        """
+        if _client_chart():
+            return ui.div(
+                {"style": "position:relative;width:100%;height:100%;"}, # chart.js sizes the canvas by this container
+                ui.tags.canvas(id="streaks_chart", role="img", aria_label="Streaks over time"),
+                ui.tags.script(ui.HTML(_streak_chart_json()), type="application/json", id="streaks_chart_data"),
+                # without the script file the server is asked for the image instead
+                ui.tags.script(ui.HTML(
+                    "window.HabitCharts ? HabitCharts.drawStreaks('streaks_chart', 'streaks_chart_data')"
+                    " : Shiny.setInputValue('streaks_chart_unavailable', true, {priority: 'event'});"
+                )),
+            )
 
-        max_streak = int(df["streak"].max())
-        upper = max_streak + 3  # upper limit for the y-axis
-        ax.set_ylim(0, max(upper, 1))
-        ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+        # matplotlib is only imported when the image is needed, the chart in the browser doesn't use it
+        from models.streak_plot import streaks_png_async
 
-        # X-axis: adaptive locator/formatter to avoid too many ticks
-        locator = mdates.AutoDateLocator(minticks=4, maxticks=8)
-        ax.xaxis.set_major_locator(locator)
-        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
-        ax.xaxis.set_minor_locator(ticker.NullLocator())
-        fig.autofmt_xdate(rotation=0)
+        df = _streak_history_df()
 
-        ax.legend(loc="best")
-        ax.grid(True, axis="y", linestyle=":", linewidth=0.8)
+        # size of the container, it is reported by the browser because of the shiny-report-size class
+        width = session.clientdata.output_width("streaks_plot") or 600
+        height = session.clientdata.output_height("streaks_plot") or 400
+        pixelratio = session.clientdata.pixelratio() or 1
 
-        return fig
+        src = await streaks_png_async(df, int(width), int(height), float(pixelratio))
+        return ui.img(src=src, alt="Streaks over time", style="width:100%;height:100%;object-fit:contain;")
 
 
     def _as_csv_bytes(df):
@@ -211,6 +187,25 @@ def habit_analytics_server(input, output, session):
         return df.to_csv(index=False, date_format="%Y-%m-%d").encode("utf-8")
 
 
+    def _cached_csv(name, frame, *key):
+        """
+        helper function for the downloads, returns the csv file of a download from the result cache,
+        the frame is only built again after the user wrote something
+
+        Parameters:
+        - name: string, name of the download
+        - frame: function, receives the analytics snapshot of the user and returns the dataframe to download
+        - key: further values the download depends on, e.g. the selection of the user
+        """
+        user = _current_user()
+
+        # the snapshot is taken from the cache as well (not from _snapshot), so it always has the same data version as the entry
+        def compute():
+            return _as_csv_bytes(frame(AnalyticsSnapshot.for_user(user.user_id)))
+
+        return cached_for_user(name, user.user_id, compute, *key)
+
+
     @output
     @render.ui
     def active_habits_button():
@@ -218,8 +213,7 @@ def habit_analytics_server(input, output, session):
         renders the Active - Habits - Download - Button
         only clickable when there is data
         """
-        user = state()["current_user"]
-        rows = [h.to_dict() for h in Habit.list_by_user(user.user_id)]
+        rows = _snapshot().active()
 
         if not rows:
             return ui.layout_columns(
@@ -240,15 +234,7 @@ def habit_analytics_server(input, output, session):
         """
         prepares the data for the active habits csv download
         """
-        user = state()["current_user"]
-        rows = [h.to_dict() for h in Habit.list_by_user(user.user_id)]
-
-        df = pd.DataFrame(rows)
-
-        if df.empty:
-            df = pd.DataFrame(columns=["habitID","HabitName","IsActive","DateCreated","LastChecked","Periodtype","EqualsToDays"])
-
-        yield _as_csv_bytes(df)
+        yield _cached_csv("dl_active_habits", AnalyticsSnapshot.active_frame)
 
 
     @reactive.Calc
@@ -257,16 +243,7 @@ def habit_analytics_server(input, output, session):
         prepares the data for the input select,
         returns all unique periods which have been used by the current user
         """
-        user = state()["current_user"]
-
-        rows = [h.to_dict() for h in Habit.list_by_user(user.user_id)]
-        if not rows:
-            return []  
-        
-        df = pd.DataFrame(rows)
-
-        periods = sorted(df["Periodtype"].dropna().unique().tolist())
-        return periods
+        return _snapshot().periods()
     
 
     @output
@@ -298,20 +275,9 @@ def habit_analytics_server(input, output, session):
         """
         req(input.analyze_habit_period()) # needs the user to select a period
 
-        user = state()["current_user"]
         period = input.analyze_habit_period() # period selected by the user
-        rows = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
 
-        df = pd.DataFrame(rows) 
-        filtered_df = df[df["Periodtype"] == period] # filter df for the user input
-
-        if filtered_df is None or filtered_df.empty:
-            filtered_df = pd.DataFrame(columns=[
-                "habitID","userID","HabitName","periodtypeID","IsActive",
-                "DateCreated","LastChecked","Periodtype","EqualsToDays"
-            ])
-
-        yield _as_csv_bytes(filtered_df)
+        yield _cached_csv("dl_periodicity", lambda snapshot: snapshot.periodicity_frame(period), period)
 
 
     @output
@@ -321,8 +287,7 @@ def habit_analytics_server(input, output, session):
         renders the Archived + records streak - Download - Button
         only clickable when there is data
         """
-        user = state()["current_user"]
-        rows = [h.to_dict() for h in Habit.archived_list_by_user(user.user_id)]
+        rows = _snapshot().archived()
 
         if not rows:
             return ui.layout_columns(
@@ -342,39 +307,7 @@ def habit_analytics_server(input, output, session):
         """
         prepares the data for the archived habits and their record streaks
         """
-        user = state()["current_user"]
-        arch = [h.to_dict() for h in Habit.archived_list_by_user(user.user_id)]
-
-        if not arch:
-            yield _as_csv_bytes(pd.DataFrame(columns=["habitID","HabitName","EqualsToDays","record_streak"]))
-            return
-
-        habit_ids = [a["habitID"] for a in arch]
-        checks_map = get_checks_for_habits(habit_ids)
-
-        rows = []
-        for a in arch:
-            hid = a["habitID"]
-            name = a.get("HabitName")
-            try:
-                equal_days = max(1, int(a.get("EqualsToDays") or 1))
-            except (TypeError, ValueError):
-                equal_days = 1
-
-            s = Habit.highest_streak(
-                check_dates=sorted(set(checks_map.get(hid, []))),
-                equal_days=equal_days
-            )
-
-            rows.append({
-                "habitID": hid,
-                "HabitName": name,
-                "EqualsToDays": equal_days,
-                "record_streak": int(s or 0),
-            })
-
-        df = pd.DataFrame(rows).sort_values(["HabitName","habitID"])
-        yield _as_csv_bytes(df)
+        yield _cached_csv("dl_archived_records", AnalyticsSnapshot.archived_records_frame)
 
 
     @output
@@ -384,8 +317,7 @@ def habit_analytics_server(input, output, session):
         renders the completions per habit - Download - Button
         only clickable when there is data
         """
-        user = state()["current_user"]
-        rows = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
+        rows = _snapshot().habits
 
         if not rows:
             return ui.layout_columns(
@@ -405,29 +337,7 @@ def habit_analytics_server(input, output, session):
         """
         prepares the data for the completions per habit download
         """
-        user = state()["current_user"]
-
-        habits = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
-
-        if not habits:
-            yield _as_csv_bytes(pd.DataFrame(columns=["habitID", "HabitName", "check_count"]))
-            return
-
-        habit_ids = [a["habitID"] for a in habits]
-        checks_map = get_checks_for_habits(habit_ids)
-
-        rows = []
-        for a in habits:
-            hid = a["habitID"]
-            checks = checks_map.get(hid, []) or []
-            rows.append({
-                "habitID": hid,
-                "HabitName": a.get("HabitName"),
-                "check_count": len(checks), # the number of checks per habit
-            })
-
-        df = pd.DataFrame(rows).sort_values(["HabitName", "habitID"])
-        yield _as_csv_bytes(df)
+        yield _cached_csv("dl_completions", AnalyticsSnapshot.completions_frame)
 
 
     @output
@@ -437,8 +347,7 @@ def habit_analytics_server(input, output, session):
         renders the Longest run overall - Download - Button
         only clickable when there is data
         """
-        user = state()["current_user"]
-        rows = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
+        rows = _snapshot().habits
 
         if not rows:
             return ui.layout_columns(
@@ -458,42 +367,7 @@ def habit_analytics_server(input, output, session):
         """
         prepares the data for the longest run overall download
         """
-        user = state()["current_user"]
-        habits = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
-
-        if not habits:
-            yield _as_csv_bytes(pd.DataFrame(columns=["habitID","HabitName","EqualsToDays","record_streak"]))
-            return
-
-        habit_ids = [a["habitID"] for a in habits]
-        checks_map = get_checks_for_habits(habit_ids)
-
-        rows = []
-        for a in habits:
-            hid = a["habitID"]
-            name = a.get("HabitName")
-            try:
-                equal_days = a.get("EqualsToDays") or 1
-            except (TypeError, ValueError):
-                equal_days = 1
-
-            # calculates the highest streak for the current habit
-            s = Habit.highest_streak(
-                check_dates=sorted(set(checks_map.get(hid, []))),
-                equal_days=equal_days
-            )
-
-            rows.append({
-                "habitID": hid,
-                "HabitName": name,
-                "EqualsToDays": equal_days,
-                "record_streak": int(s or 0),
-            })
-
-        df = pd.DataFrame(rows)
-        top = df.sort_values(["record_streak", "HabitName", "habitID"],
-                            ascending=[False, True, True]).head(1)
-        yield _as_csv_bytes(top)
+        yield _cached_csv("dl_longest_overall", AnalyticsSnapshot.longest_overall_frame)
 
 
     @output
@@ -503,8 +377,7 @@ def habit_analytics_server(input, output, session):
         renders the Longest run for a selected habit - Download - Button
         only clickable when there is data
         """
-        user = state()["current_user"]
-        rows = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
+        rows = _snapshot().habits
 
         if not rows:
             return ui.layout_columns(
@@ -512,11 +385,10 @@ def habit_analytics_server(input, output, session):
                 ui.column(10, ui.input_select("analyze_habit_record", label=None, choices=[])),
             )
         
-        habit_ids = [a["habitID"] for a in rows]
-        checks_map = get_checks_for_habits(habit_ids)
+        records = _snapshot().records
         
         # when there are no checks, than there can be no streak
-        if not checks_map:
+        if not records:
             return ui.layout_columns(
                 ui.column(10, ui.input_action_button("dl_longest_for_habit", "Longest run (selected habit)", disabled = True, style = "width:100%;")),
                 ui.column(10, ui.input_select("analyze_habit_record", label=None, choices=[])),
@@ -540,28 +412,159 @@ def habit_analytics_server(input, output, session):
         req(input.analyze_habit_record())
 
         sel_habit = input.analyze_habit_record() # user selection for the habit
-        user = state()["current_user"]
 
-        rows = [h.to_dict() for h in Habit.full_list_by_user(user.user_id)]
-        meta = next((r for r in rows if r.get("HabitName") == sel_habit), None) # reverse search from the selected habit name
+        yield _cached_csv("dl_longest_for_habit", lambda snapshot: snapshot.longest_for_habit_frame(sel_habit), sel_habit)
+
+
+    @output
+    @render.ui
+    def activity_log_button():
+        """
+        renders the Activity log - Download - Button
+        only clickable when there is data
+        """
+        if not _snapshot().has_checks():
+            return ui.layout_columns(
+                ui.column(10, ui.input_action_button("dl_activity_log", "Activity log (all checks)", disabled = True, style = "width:100%;")),
+                ui.column(10),
+            )
+
+        return ui.layout_columns(
+            ui.column(10, ui.download_button("dl_activity_log", "Activity log (all checks)", style = "width:100%;")),
+            ui.column(10),
+        )
+
+
+    @output
+    @render.download(filename="activity_log.csv")
+    def dl_activity_log():
+        """
+        streams every check of the user to the csv file,
+        the rows are read from the database in chunks and never held in memory all at once
+        """
+        user = _current_user()
+        yield from csv_chunks(ACTIVITY_LOG_COLUMNS, iter_activity_log(user.user_id, chunk_size=EXPORT_CHUNK_SIZE))
+
+
+    @output
+    @render.ui
+    def streak_history_button():
+        """
+        renders the Streak history - Download - Button
+        only clickable when there is data
+        """
+        if not _snapshot().has_checks():
+            return ui.layout_columns(
+                ui.column(10, ui.input_action_button("dl_streak_history", "Streak history (all time)", disabled = True, style = "width:100%;")),
+                ui.column(10),
+            )
+
+        return ui.layout_columns(
+            ui.column(10, ui.download_button("dl_streak_history", "Streak history (all time)", style = "width:100%;")),
+            ui.column(10),
+        )
+
+
+    @output
+    @render.download(filename="streak_history.csv")
+    def dl_streak_history():
+        """
+        streams the streak of every habit (active + archived) for each day since its first check,
+        the history is calculated and written habit by habit
+        """
+        user = _current_user()
+        snapshot = AnalyticsSnapshot.for_user(user.user_id)
+        yield from csv_chunks(HISTORY_COLUMNS, iter_streak_history(snapshot.habits, snapshot.checks))
+
+
+    @output
+    @render.ui
+    def parquet_button():
+        """
+        renders the typed Parquet - Download - Button with the selection of the dataset
+        only clickable when there is data and pyarrow is installed
+        """
+        choices = dict(COLUMNAR_DATASETS)
+
+        if not columnar_available():
+            return ui.layout_columns(
+                ui.column(10, ui.input_action_button("dl_parquet", "Parquet (requires pyarrow)", disabled = True, style = "width:100%;")),
+                ui.column(10, ui.input_select("parquet_dataset", label=None, choices=choices)),
+            )
+
+        if not _snapshot().habits:
+            return ui.layout_columns(
+                ui.column(10, ui.input_action_button("dl_parquet", "Parquet", disabled = True, style = "width:100%;")),
+                ui.column(10, ui.input_select("parquet_dataset", label=None, choices=choices)),
+            )
+
+        return ui.layout_columns(
+            ui.column(10, ui.download_button("dl_parquet", "Parquet", style = "width:100%;")),
+            ui.column(10, ui.input_select("parquet_dataset", label=None, choices=choices)),
+        )
+
+
+    def _parquet_dataset():
+        """
+        returns the dataset selected for the parquet download, the habits as long as nothing was selected
+        """
+        dataset = input.parquet_dataset() if "parquet_dataset" in input else None
+        return dataset if dataset in COLUMNAR_DATASETS else "habits"
+
+
+    @output
+    @render.download(filename=lambda: f"{_parquet_dataset()}.parquet")
+    def dl_parquet():
+        """
+        prepares the selected dataset as parquet file with typed columns (int32 ids, dates, categorical names),
+        so it can be loaded by other tools without parsing text
+        """
+        dataset = _parquet_dataset()
+        user = _current_user()
+        snapshot = AnalyticsSnapshot.for_user(user.user_id)
+
+        if dataset == "activities":
+            yield activities_parquet(iter_activity_log(user.user_id, chunk_size=EXPORT_CHUNK_SIZE))
+        elif dataset == "streak_history":
+            yield streak_history_parquet(habit_series(snapshot.habits, snapshot.checks))
+        else:
+            yield habits_parquet(snapshot)
 
-        if not meta:
-            yield _as_csv_bytes(pd.DataFrame(columns=["habitID","HabitName","EqualsToDays","record_streak"]))
-            return
 
-        hid = meta["habitID"]
-        equal_days = int(meta.get("EqualsToDays") or 1)
+    @output
+    @render.ui
+    def bundle_button():
+        """
+        renders the All CSVs as ZIP - Download - Button
+        only clickable when there is data
+        """
+        if not _snapshot().habits:
+            return ui.layout_columns(
+                ui.column(10, ui.input_action_button("dl_bundle", "All CSVs (ZIP)", disabled = True, style = "width:100%;")),
+                ui.column(10),
+            )
+
+        return ui.layout_columns(
+            ui.column(10, ui.download_button("dl_bundle", "All CSVs (ZIP)", style = "width:100%;")),
+            ui.column(10),
+        )
+
+
+    @output
+    @render.download(filename="habit_analytics.zip")
+    def dl_bundle():
+        """
+        streams the six csv downloads of this page in one zip archive
+        all tables are built from one snapshot, the selections of the period and the habit are used when they are set
+        """
+        user = _current_user()
+        period = input.analyze_habit_period() if "analyze_habit_period" in input else None
+        habit_name = input.analyze_habit_record() if "analyze_habit_record" in input else None
 
-        checks = get_checks_for_habits([hid]).get(hid, [])
-        streak = int(Habit.highest_streak(check_dates=sorted(set(checks)), equal_days=equal_days) or 0)
+        snapshot = AnalyticsSnapshot.for_user(user.user_id)
+        files = ((name, _as_csv_bytes(df)) for name, df in snapshot.all_frames(period, habit_name))
 
-        df = pd.DataFrame([{
-            "habitID": hid,
-            "HabitName": sel_habit,
-            "EqualsToDays": equal_days,
-            "record_streak": streak,
-        }])
-        yield _as_csv_bytes(df)
+        yield from zip_chunks(files)
 
 
     @reactive.Effect
@@ -570,4 +573,4 @@ def habit_analytics_server(input, output, session):
         """
         handles the button click to go back to the home screen
         """
-        update_state(current_page="home_screen")
+        state.update_state(current_page="home_screen")
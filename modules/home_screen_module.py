@@ -3,8 +3,6 @@ Module creates the page after the login
 The home screen
 """
 from shiny import render, ui, reactive
-from services.state import state, update_state
-from services.database import mark_habit_as_checked
 from models.habit import Habit
 from datetime import datetime, date
 
@@ -33,9 +31,7 @@ def home_screen_ui():
     )
 
 
-def home_screen_server(input, output, session):
-
-    refresh_habits = reactive.Value(0)
+def home_screen_server(input, output, session, state):
 
     @reactive.Calc
     def _habits_for_home():
@@ -49,8 +45,8 @@ def home_screen_server(input, output, session):
         check and today is the basis for the sort into one of the containers
         - optional habits are dependent on the point of time they are currently in their allowed check window (= period)
         """
-        user = state()["current_user"]
-        _ = refresh_habits()
+        user = state.get("current_user")
+        _ = state.get("refresh_data") # re-run after the habits or checks of the user changed
         if user is None:
             return [], [], []
 
@@ -170,7 +166,7 @@ def home_screen_server(input, output, session):
         """
         handles the click on the button to Mark the selected habits as done
         """
-        user = state()["current_user"]
+        user = state.get("current_user")
         if user is None:
             return
 
@@ -182,18 +178,16 @@ def home_screen_server(input, output, session):
 
         ids = [int(x) for x in selected]
 
-        errors = []
-        for hid in ids:
-            try:
-                # write to the database
-                mark_habit_as_checked(hid)
-            except Exception as e:
-                errors.append((hid, str(e)))
+        try:
+            # write all checks to the database in one transaction
+            errors = Habit.mark_checked_many(ids)
+        except Exception as e:
+            errors = [(hid, str(e)) for hid in ids]
 
         ui.update_checkbox_group("home_due", selected=[])
         ui.update_checkbox_group("home_opt", selected=[])
         ui.update_checkbox_group("home_broken", selected=[])
-        refresh_habits.set(refresh_habits() + 1)
+        state.bump("refresh_data")
 
         if errors:
             ui.notification_show(
@@ -208,7 +202,7 @@ def home_screen_server(input, output, session):
         """
         handles the button to go back to the user selection
         """
-        update_state(
+        state.update_state(
             current_user=None,
             current_page="user_selection"
         )
@@ -220,7 +214,7 @@ def home_screen_server(input, output, session):
         """
         handles the button click on edit habits
         """
-        update_state(current_page="edit_habits")
+        state.update_state(current_page="edit_habits")
 
 
     @reactive.Effect
@@ -229,5 +223,5 @@ def home_screen_server(input, output, session):
         """
         handles the button click on analyze habits
         """
-        update_state(current_page="analyze_habits")
+        state.update_state(current_page="analyze_habits")
 
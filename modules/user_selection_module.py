@@ -5,7 +5,7 @@ The user selection screen
 from shiny import ui, reactive, render
 from models.user import User
 from services.database import user_exists
-from services.state import state, update_state
+from config import USER_PAGE_SIZE
 
 def user_selection_ui():
     """
@@ -19,11 +19,20 @@ def user_selection_ui():
             ui.img(src="images/lifestyle.svg", class_="login-img"), # Logo
             ui.h3("Please click your name or create a new one"),
 
+            ui.input_text("user_search", label=None, placeholder="Search your name", width="100%"),
+
+            # the tiles are plain buttons, one delegated click handler reports the selected user (static/js/user_picker.js)
             ui.div(
                 {"class": "profile-container"},
                 ui.output_ui("user_tiles")
             ),
 
+            ui.div(
+                {"class": "user-pager"},
+                ui.input_action_button("users_prev", "Previous", disabled=True),
+                ui.input_action_button("users_next", "Next", disabled=True)
+            ),
+
             ui.div( 
                 {"class": "new-user-container"},
                 ui.input_text("input_create", label=None, placeholder="Create new user"), # create new user text field
@@ -33,31 +42,91 @@ def user_selection_ui():
     )
 
 
-def user_selection_server(input, output, session):
+def user_selection_server(input, output, session, state):
+
+    # keyset of the shown page: the (Username, userID) after which every page starts, None for the first page
+    # the keys of the previous pages are kept, so the user can go back
+    _page_keys = reactive.Value([None])
+
+
+    def _search():
+        """
+        returns the search text of the user
+        """
+        return input.user_search().strip() if "user_search" in input else ""
+
+
+    @reactive.effect
+    @reactive.event(input.user_search, ignore_init=True)
+    def _reset_pages():
+        """
+        a new search starts at the first page
+        """
+        _page_keys.set([None])
+
+
+    @reactive.Calc
+    def _page_users():
+        """
+        loads the users of the current page, one more than shown to know whether there is a next page
+        """
+        # creates a dependency on this reactive value, when it changes the list is loaded again
+        # for example after user deletion or creating a new one
+        state.get("refresh_user")
+
+        return User.page(_search(), after=_page_keys.get()[-1], limit=USER_PAGE_SIZE + 1)
+
 
     @output
     @render.ui
     def user_tiles():
         """
-        function to render the user name tiles when there are already user in the database
+        function to render the user name tiles of the current page
         """
-        tiles = []
+        users = _page_users()[:USER_PAGE_SIZE]
 
-        # creates a dependency on this reactive value, when it changes the function is called again
-        # for example after user deletion or creating a new one
-        state()["refresh_user"]
-
-        # add tiles for previously created users
-        for user in User.get_all():
-            tiles.append(
-                ui.div(
-                    {"class": "profile-card", "id": f"user_{user.user_id}"},
-                    ui.input_action_button(f"select_{user.user_id}", user.username)
-                )
+        if not users and _search():
+            return ui.p("No user found")
+
+        return [
+            ui.div(
+                {"class": "profile-card", "id": f"user_{user.user_id}"},
+                ui.tags.button(user.username, type="button", class_="btn btn-default", data_user_id=str(user.user_id))
             )
-                
-        return tiles
-    
+            for user in users
+        ]
+
+
+    @reactive.effect
+    def toggle_pager():
+        """
+        the buttons to page through the users are only clickable when there is a previous / next page
+        """
+        ui.update_action_button("users_prev", disabled=len(_page_keys.get()) == 1)
+        ui.update_action_button("users_next", disabled=len(_page_users()) <= USER_PAGE_SIZE)
+
+
+    @reactive.effect
+    @reactive.event(input.users_next)
+    def _next_page():
+        """
+        the next page starts after the last user of the current page
+        """
+        users = _page_users()
+        if len(users) > USER_PAGE_SIZE:
+            _page_keys.set(_page_keys.get() + [users[USER_PAGE_SIZE - 1].page_key])
+
+
+    @reactive.effect
+    @reactive.event(input.users_prev)
+    def _previous_page():
+        """
+        go back to the page before
+        """
+        keys = _page_keys.get()
+        if len(keys) > 1:
+            _page_keys.set(keys[:-1])
+
 
     @reactive.effect
     def toggle_button():
@@ -72,19 +141,22 @@ def user_selection_server(input, output, session):
 
 
     @reactive.effect
-    def handle_user_clicks():
+    @reactive.event(input.select_user)
+    def handle_user_click():
         """
         reactive function to handle the user selection for already existing users
-        - the user needs to click on one of the buttons with a name, after the current_user is set and the application
-        switches to the home screen
+        - the user needs to click on one of the tiles with a name, the browser sends the ID of the user as select_user,
+        after the current_user is set and the application switches to the home screen
+        - one effect for all users, a click only loads the selected user
         """
-        state()["refresh_user"]
+        user = User.get(int(input.select_user()))
+
+        # the user could have been deleted in another session meanwhile
+        if user is None:
+            state.bump("refresh_user")
+            return
 
-        for user in User.get_all():
-            @reactive.effect
-            @reactive.event(getattr(input, f"select_{user.user_id}"), ignore_init=True)
-            def _(user=user):
-                update_state(current_user=user, current_page="home_screen")
+        state.update_state(current_user=user, current_page="home_screen")
 
 
     @reactive.effect
@@ -110,5 +182,5 @@ def user_selection_server(input, output, session):
             )
         else:
             new_user = User.create(name)
-            update_state(refresh_user =+ 1) # update for dependency
-            update_state(current_user=new_user, current_page="home_screen") #set user and current page to homescreen
+            state.bump("refresh_user") # update for dependency
+            state.update_state(current_user=new_user, current_page="home_screen") #set user and current page to homescreen
@@ -0,0 +1,112 @@
+"""
+Script handles the result cache for streak and analytics computations
+Results are stored per user under the data version of the user (user.DataVersion),
+every write to the habits or activities increases the version, so old entries are never hit again
+and are evicted as least recently used
+"""
+import threading
+from collections import OrderedDict
+
+from config import RESULT_CACHE_SIZE
+from services import database
+
+
+class ResultCache:
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> result, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key, default=None):
+        """
+        returns the cached result for the key or the default without computing anything,
+        only a hit is counted, a miss is counted by the following get_or_compute
+
+        Parameters:
+        - key: tuple, hashable key of the result
+        - default: value returned when there is no entry
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def get_or_compute(self, key, compute):
+        """
+        returns the cached result for the key or computes and stores it
+        the result is shared between callers, so it must not be modified
+
+        Parameters:
+        - key: tuple, hashable key of the result
+        - compute: function without arguments which calculates the result
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        # computed outside the lock, two threads may compute the same result once each
+        result = compute()
+
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return result
+
+
+    def stats(self):
+        """
+        returns size and hit / miss counters of the cache
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+    def clear(self):
+        """
+        remove all entries, the counters are kept
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+# one cache for the whole process, all sessions of the same user share their results
+results = ResultCache(max_size=RESULT_CACHE_SIZE)
+
+
+def cached_for_user(name, user_id, compute, *key):
+    """
+    returns the result of compute for the current data version of the user,
+    computes it only when the user wrote something since the last call
+
+    Parameters:
+    - name: string, name of the computation (e.g. ongoing_streaks)
+    - user_id: integer, ID of the user
+    - compute: function without arguments which calculates the result
+    - key: further hashable values the result depends on (e.g. the date of today)
+    """
+    version = database.get_data_version(user_id)
+    if version is None:
+        return compute()
+
+    # the database path is part of the key, so separate database files never share results
+    return results.get_or_compute((str(database.database_path()), name, user_id, version) + key, compute)
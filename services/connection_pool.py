@@ -0,0 +1,159 @@
+"""
+Script handles a bounded pool of long-lived sqlite connections
+Every thread borrows its own connection, which is configured only once when it is opened
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# pragmas a profile is allowed to set, the values are written into the statement
+ALLOWED_PRAGMAS = ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout")
+
+
+class ConnectionPool:
+    def __init__(self, db_path, max_size=8, statement_cache=128, pragmas=None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.statement_cache = statement_cache
+        self.pragmas = dict(pragmas or {})
+
+        unknown = set(self.pragmas) - set(ALLOWED_PRAGMAS)
+        if unknown:
+            raise ValueError(f"Unsupported pragma(s) in profile: {sorted(unknown)}")
+
+        self._lock = threading.Lock()
+        self._conns = OrderedDict() # thread id -> connection, least recently used first
+        self._borrowed = {} # thread id -> connection the thread currently works with
+        self._after_commit = {} # thread id -> functions to call when the transaction of the thread is committed
+        self.hits = 0
+        self.misses = 0
+
+
+    def _open(self):
+        """
+        open and configure a new connection
+        check_same_thread is disabled, because idle connections can be closed by another thread on eviction
+        """
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.statement_cache
+        )
+        conn.row_factory = sqlite3.Row
+
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+        return conn
+
+
+    def settings(self):
+        """
+        read the active value of every profile pragma back from the connection of the current thread
+        """
+        with self.connection() as conn:
+            return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in ALLOWED_PRAGMAS}
+
+
+    def _acquire(self, tid):
+        """
+        returns the connection for the thread and if it has to be closed after use,
+        which is the case when the pool is full and no idle connection can be evicted
+        the connection is marked as borrowed under the same lock, so no other thread can evict it in between
+
+        Parameters:
+        - tid: integer, ident of the current thread
+        """
+        with self._lock:
+            conn = self._conns.get(tid)
+            if conn is not None:
+                self.hits += 1
+                self._conns.move_to_end(tid)
+                self._borrowed[tid] = conn
+                return conn, False
+            self.misses += 1
+
+        conn = self._open()
+
+        with self._lock:
+            self._borrowed[tid] = conn
+            if len(self._conns) >= self.max_size:
+                idle = next((t for t in self._conns if t not in self._borrowed), None)
+                if idle is None:
+                    # every pooled connection is busy, this one is only used once
+                    return conn, True
+                self._conns.pop(idle).close()
+            self._conns[tid] = conn
+
+        return conn, False
+
+
+    @contextmanager
+    def connection(self):
+        """
+        borrow the connection of the current thread
+        the outermost borrow commits on success and rolls back on errors,
+        nested borrows (e.g. edit_habit calling get_habit) share the same transaction
+        """
+        tid = threading.get_ident()
+
+        if tid in self._borrowed:
+            yield self._borrowed[tid]
+            return
+
+        conn, transient = self._acquire(tid) # also marks it as borrowed
+
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+            for callback in self._after_commit.get(tid, ()):
+                callback()
+        finally:
+            del self._borrowed[tid]
+            self._after_commit.pop(tid, None)
+            if transient:
+                conn.close()
+
+
+    def after_commit(self, callback):
+        """
+        call a function once the current transaction of the thread is committed,
+        e.g. to update an in-memory cache only with rows which really were written
+        the function is dropped when the transaction is rolled back
+
+        Parameters:
+        - callback: function without arguments
+        """
+        tid = threading.get_ident()
+        if tid not in self._borrowed:
+            raise RuntimeError("after_commit can only be used while a connection is borrowed")
+        self._after_commit.setdefault(tid, []).append(callback)
+
+
+    def stats(self):
+        """
+        returns the pool size and the hit / miss counters
+        """
+        with self._lock:
+            return {
+                "size": len(self._conns),
+                "max_size": self.max_size,
+                "in_use": len(self._borrowed),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+    def close_all(self):
+        """
+        close every idle pooled connection, e.g. on shutdown or in tests
+        """
+        with self._lock:
+            for tid in [t for t in self._conns if t not in self._borrowed]:
+                self._conns.pop(tid).close()
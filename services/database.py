@@ -1,91 +1,68 @@
 """
 Script handles the database setup
 """
-from config import DB_PATH
+from config import DB_PATH, DB_POOL_SIZE, DB_STATEMENT_CACHE_SIZE, DB_PROFILES, DB_PROFILE, DB_MIGRATION_CHUNK_SIZE
+from config import DB_ID_LIST_SIZES, DB_ID_TEMP_TABLE_THRESHOLD
+from services.connection_pool import ConnectionPool
+from services.migrations import run_migrations
 
 import sqlite3
 import re
-from datetime import datetime
+import threading
+from array import array
+from datetime import date, datetime, timedelta
 from collections import defaultdict
 
 
-def setup_database():
-    """
-    Create all tables for the habittracker application if they don't exist
-    """
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
+if DB_PROFILE not in DB_PROFILES:
+    raise ValueError(f"Unknown database profile '{DB_PROFILE}', choose one of {sorted(DB_PROFILES)}")
 
-        # enable foreign key constraints
-        cursor.execute("PRAGMA foreign_keys = ON;")
+# every function borrows the long-lived connection of its thread from this pool
+# the pragmas of the selected performance profile are applied when a connection is opened
+_pool = ConnectionPool(
+    DB_PATH,
+    max_size=DB_POOL_SIZE,
+    statement_cache=DB_STATEMENT_CACHE_SIZE,
+    pragmas=DB_PROFILES[DB_PROFILE]
+)
 
-        # create user table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user (
-                userID INTEGER PRIMARY KEY AUTOINCREMENT,
-                Username TEXT UNIQUE NOT NULL,
-                DateCreated TIMESTAMP DEFAULT (datetime('now','localtime'))
-            )
-        """)
 
-        # create habits table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS habits (
-                habitID INTEGER PRIMARY KEY AUTOINCREMENT,
-                userID INTEGER NOT NULL,
-                periodtypeID INTEGER NOT NULL,
-                HabitName TEXT NOT NULL,
-                DateCreated TIMESTAMP DEFAULT (datetime('now','localtime')),
-                LastChecked TIMESTAMP,
-                IsActive BOOLEAN DEFAULT 1,
-                FOREIGN KEY (userID) REFERENCES user(userID),
-                FOREIGN KEY (periodtypeID) REFERENCES periodtypes(periodtypeID),
-                UNIQUE(userID, HabitName)
-            )
-        """)
+def pool_stats():
+    """
+    returns size and hit / miss counters of the connection pool
+    """
+    return _pool.stats()
 
-        # create periodtypes table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS periodtypes (
-                periodtypeID INTEGER PRIMARY KEY AUTOINCREMENT,
-                Periodtype TEXT UNIQUE NOT NULL,
-                EqualsToDays INTEGER NOT NULL
-            )
-        """)
 
-        # create activities table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS activities (
-                activityID INTEGER PRIMARY KEY AUTOINCREMENT,
-                habitID INTEGER NOT NULL,
-                ActivityDate TIMESTAMP DEFAULT (datetime('now','localtime')),
-                FOREIGN KEY (habitID) REFERENCES habits(habitID),
-                UNIQUE(habitID, ActivityDate)
-            )
-        """)
+def database_path():
+    """
+    returns the path of the database file the connection pool works on
+    """
+    return _pool.db_path
 
-        # ---------create indices for faster lookups---------------
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_habits_user_active
-            ON habits(userID, IsActive)
-        """)
 
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_habits_periodtype
-            ON habits(periodtypeID)
-        """)
+def setup_database():
+    """
+    Create or upgrade all tables for the habittracker application,
+    the schema is built by the versioned migration steps in migrations.py
+    returns the active settings of the performance profile, so they can be reported at startup
+    """
+    migrate()
+    periodtypes.clear() # loaded again from the migrated database
 
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_periodtypes_eqdays
-            ON periodtypes(EqualsToDays)
-        """)
+    return _pool.settings()
 
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_activities_habit_date
-            ON activities(habitID, ActivityDate)
-        """)
 
-        conn.commit()
+def migrate(dry_run=False):
+    """
+    Apply all pending schema migrations, backfills are committed in chunks
+    returns the schema version of the database
+
+    Parameters:
+    - dry_run: boolean, only print the pending migrations
+    """
+    with _pool.connection() as conn:
+        return run_migrations(conn, dry_run=dry_run, chunk_size=DB_MIGRATION_CHUNK_SIZE)
 
 
 # ----------------- helper functions -------------------
@@ -117,36 +94,198 @@ def _normalize_period(period_str):
     return ("Daily", 1)
 
 
+class PeriodtypeCache:
+    """
+    process-wide copy of the periodtypes table (label -> id, id -> days)
+    the table is small and its rows are never changed or deleted, so it is loaded once per database file
+    and only extended after a new periodtype was committed
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db_path = None # database file the cache was loaded from
+        self._ids = {} # Periodtype label -> periodtypeID
+        self._days = {} # periodtypeID -> EqualsToDays
+
+    def _ensure_loaded(self, conn):
+        """
+        helper function, loads the table when the cache is empty or belongs to another database file
+
+        Parameters:
+        - conn: sqlite connection of the current transaction
+        """
+        db_path = str(_pool.db_path)
+        with self._lock:
+            if self._db_path == db_path:
+                return
+
+        rows = conn.execute("SELECT periodtypeID, Periodtype, EqualsToDays FROM periodtypes").fetchall()
+
+        with self._lock:
+            self._ids = {r["Periodtype"]: r["periodtypeID"] for r in rows}
+            self._days = {r["periodtypeID"]: r["EqualsToDays"] for r in rows}
+            self._db_path = db_path
+
+    def get_id(self, conn, period_label):
+        """
+        returns the periodtypeID of a label or None
+
+        Parameters:
+        - conn: sqlite connection of the current transaction
+        - period_label: string, name of the period
+        """
+        self._ensure_loaded(conn)
+        with self._lock:
+            return self._ids.get(period_label)
+
+    def days(self, conn, periodtype_id):
+        """
+        returns the number of days of a periodtype or None
+
+        Parameters:
+        - conn: sqlite connection of the current transaction
+        - periodtype_id: integer, ID of the periodtype
+        """
+        self._ensure_loaded(conn)
+        with self._lock:
+            return self._days.get(periodtype_id)
+
+    def add(self, db_path, periodtype_id, period_label, equals_to_days):
+        """
+        adds a committed periodtype, ignored when the cache was loaded from another database file meanwhile
+
+        Parameters:
+        - db_path: string, database file the periodtype was written to
+        - periodtype_id: integer, ID of the new periodtype
+        - period_label: string, name of the period
+        - equals_to_days: integer, number of days of the period
+        """
+        with self._lock:
+            if self._db_path == db_path:
+                self._ids[period_label] = periodtype_id
+                self._days[periodtype_id] = equals_to_days
+
+    def clear(self):
+        """
+        forget the loaded table, it is loaded again on the next use
+        """
+        with self._lock:
+            self._db_path = None
+            self._ids, self._days = {}, {}
+
+
+periodtypes = PeriodtypeCache()
+
+
 def get_or_create_periodtype(period_label, equals_to_days):
     """
     Returns periodtypeID for a given label or 
     creates it if missing
+    known labels are taken from the periodtype cache without a query, labels missing in the cache are
+    looked up in the table before one is created,
+    when called within a transaction (e.g. add_habit) a new periodtype is written in the same transaction
 
     Parameters:
     - period_label: string, name of the selected period (e.g. Daily, Custom, etc.)
     - equals_to_days: integer, number of days which represent this period (e.g. Daily = 1)
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT periodtypeID 
-            FROM periodtypes 
-            WHERE Periodtype = ?
-        """, (period_label,))
-
-        row = cursor.fetchone()
+    with _pool.connection() as conn:
+        periodtype_id = periodtypes.get_id(conn, period_label)
 
-        if row:
-            return row["periodtypeID"]
+        if periodtype_id is not None:
+            return periodtype_id
 
-        cursor.execute("""
-            INSERT INTO periodtypes (Periodtype, EqualsToDays) 
+        # the label can exist without being cached, e.g. written by tests/insert_data_db.py or another process
+        cursor = conn.execute("""
+            INSERT OR IGNORE INTO periodtypes (Periodtype, EqualsToDays) 
             VALUES (?, ?)
         """, (period_label, equals_to_days))
-        conn.commit()
 
-        return cursor.lastrowid
+        if cursor.rowcount:
+            periodtype_id = cursor.lastrowid
+        else:
+            periodtype_id, equals_to_days = conn.execute("""
+                SELECT periodtypeID, EqualsToDays
+                FROM periodtypes
+                WHERE Periodtype = ?
+            """, (period_label,)).fetchone()
+
+        # the cache only learns the row once it is committed, a rollback would remove it again
+        db_path = str(_pool.db_path)
+        _pool.after_commit(lambda: periodtypes.add(db_path, periodtype_id, period_label, equals_to_days))
+
+        return periodtype_id
+
+
+EPOCH = date(1970, 1, 1)
+
+
+def _day_number(d):
+    """
+    days since 1970-01-01, the format of the day columns in the database
+
+    Parameters:
+    - d: date / datetime, the day to convert
+    """
+    if isinstance(d, datetime):
+        d = d.date()
+    return (d - EPOCH).days
+
+
+def _id_lists(conn, ids):
+    """
+    helper function, yields (sql, parameters) for a 'habitID IN (sql)' condition covering a list of ids
+    the ids are sorted and deduplicated, so queries ordered by habitID stay ordered over all chunks
+    - up to DB_ID_TEMP_TABLE_THRESHOLD ids: chunks of placeholders padded with NULL (matches nothing)
+      to one of DB_ID_LIST_SIZES, so the same few statement texts are reused from the statement cache
+    - more ids: one chunk selecting them from a temporary table of the connection, emptied again afterwards
+      (written in the transaction of the query)
+    the rows of a chunk have to be fetched before the next one is requested
+
+    Parameters:
+    - conn: sqlite3.Connection, borrowed connection the query runs on
+    - ids: iterable, habit ids
+    """
+    ids = sorted({int(i) for i in ids})
+
+    if len(ids) >= DB_ID_TEMP_TABLE_THRESHOLD:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS id_list (id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO temp.id_list (id) VALUES (?)", ((i,) for i in ids))
+        yield "SELECT id FROM temp.id_list", []
+        conn.execute("DELETE FROM temp.id_list") # when the query fails, the rollback removes the ids
+        return
+
+    largest = DB_ID_LIST_SIZES[-1]
+    for start in range(0, len(ids), largest):
+        chunk = ids[start:start + largest]
+        size = next(n for n in DB_ID_LIST_SIZES if n >= len(chunk))
+        yield ",".join(["?"] * size), chunk + [None] * (size - len(chunk))
+
+
+def _advance_streak(streak_state, day, equal_days):
+    """
+    applies one check to the streak state of a habit in O(1)
+    a run continues when the gap to the last check is not greater than the period days,
+    the same rule Habit.current_streak and Habit.highest_streak use
+    returns the new state as tuple (current, best, run start day, last check day)
+
+    Parameters:
+    - streak_state: tuple, (current, best, run start day, last check day) before the check
+    - day: integer, day number of the check, not before the last check day
+    - equal_days: integer, the value in days for the habit
+    """
+    current, best, run_start, last = streak_state
+
+    if equal_days < 1:
+        return 0, 0, None, day
+    if last == day:
+        return current, best, run_start, last
+
+    if last is None or day - last > equal_days:
+        current, run_start = 1, day
+    else:
+        current += 1
+
+    return current, max(best, current), run_start, day
 
 
 # ------------------ user specific methods -------------------
@@ -157,7 +296,7 @@ def new_user(user_name):
     Parameters:
     - user_name: str, the name the user enters
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with _pool.connection() as conn:
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -166,8 +305,6 @@ def new_user(user_name):
             VALUES (?)
         """, (user_name, ))
 
-        conn.commit()
-
         return cursor.lastrowid
 
 
@@ -178,8 +315,13 @@ def delete_user(user_id):
     Parameters:
     - user_id: integer, ID of the user to delete
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with _pool.connection() as conn:
         cursor = conn.cursor()
+
+        cursor.execute("""
+            DELETE FROM habit_streaks
+            WHERE habitID IN (SELECT habitID FROM habits WHERE userID = ?)
+        """, (user_id,))
         
         cursor.execute("""
             DELETE FROM habits 
@@ -190,8 +332,24 @@ def delete_user(user_id):
             DELETE FROM user 
             WHERE userID = ?
         """, (user_id,))
-        
-        conn.commit()
+
+
+def get_data_version(user_id):
+    """
+    Get the write counter of a user, it is increased by triggers on every change
+    of the habits or activities of the user (see migration 5)
+
+    Parameters:
+    - user_id: integer, ID of the user
+    """
+    with _pool.connection() as conn:
+        row = conn.execute("""
+            SELECT DataVersion
+            FROM user
+            WHERE userID = ?
+        """, (user_id,)).fetchone()
+
+        return row["DataVersion"] if row else None
 
 
 def user_exists(username):
@@ -201,7 +359,7 @@ def user_exists(username):
     Parameters:
     - user_name: str, the name the user enters
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with _pool.connection() as conn:
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -220,7 +378,7 @@ def get_users():
     """
     Get all users that already exist
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with _pool.connection() as conn:
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -236,6 +394,65 @@ def get_users():
         return results
 
 
+def get_user(user_id):
+    """
+    Get one user by its ID, None when it doesn't exist
+
+    Parameters:
+    - user_id: integer, ID of the user
+    """
+    with _pool.connection() as conn:
+        return conn.execute("""
+            SELECT
+                userID,
+                Username
+            FROM
+                user
+            WHERE
+                userID = ?
+        """, (user_id,)).fetchone()
+
+
+# upper bound of the username range, it sorts after every username which starts with the search text
+_LAST_CHARACTER = "\U0010ffff"
+
+
+def get_users_page(search="", after=None, limit=24):
+    """
+    Get one page of users sorted by their name (case-insensitive), optionally only the names starting with the search text
+    the next page starts after the last user of this one (keyset pagination), so every page costs the same,
+    no matter how many users exist or how far the user paged
+
+    Parameters:
+    - search: str, beginning of the username, case-insensitive
+    - after: tuple, (Username, userID) of the last user of the previous page, None for the first page
+    - limit: integer, number of users on the page
+    """
+    low = search or ""
+    after_id = -1 # the first page starts with the first name in the range
+
+    # the users of the next page are in the same range, but after the last user
+    if after is not None:
+        low, after_id = after
+
+    with _pool.connection() as conn:
+        # one statement for all pages and searches, both bounds are searched in idx_user_name_nocase
+        return conn.execute("""
+            SELECT
+                userID,
+                Username
+            FROM
+                user
+            WHERE
+                Username COLLATE NOCASE >= :low
+                AND Username COLLATE NOCASE < :high
+                AND (Username COLLATE NOCASE > :low OR userID > :after_id)
+            ORDER BY
+                Username COLLATE NOCASE, userID
+            LIMIT :limit
+        """, {"low": low, "high": (search or "") + _LAST_CHARACTER, "after_id": after_id, "limit": limit}).fetchall()
+
+
 # ------------ start of habit specific methods -------------
 
 def add_habit(user_id, habit_name, period_str, is_active):
@@ -249,9 +466,11 @@ def add_habit(user_id, habit_name, period_str, is_active):
     - is_active: boolean, active or archived - in theory the user can add new archived habits
     """
     label, days = _normalize_period(period_str)
-    periodtype_id = get_or_create_periodtype(label, days)
 
-    with sqlite3.connect(DB_PATH) as conn:
+    # the periodtype and the habit are written with one connection in one transaction
+    with _pool.connection() as conn:
+        periodtype_id = get_or_create_periodtype(label, days)
+
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -260,7 +479,6 @@ def add_habit(user_id, habit_name, period_str, is_active):
         """, (user_id, periodtype_id, habit_name, int(is_active)))
         hid = cursor.lastrowid
 
-        conn.commit()
         return hid
 
 
@@ -277,9 +495,10 @@ def edit_habit(habit_id, habit_name, period_str, is_active):
     - is_active: integer, either archived = 0 or active = 1
     """
     label, days = _normalize_period(period_str)
-    periodtype_id = get_or_create_periodtype(label, days)
 
-    with sqlite3.connect(DB_PATH) as conn:
+    # the periodtype and the changes of the habit are written with one connection in one transaction
+    with _pool.connection() as conn:
+        periodtype_id = get_or_create_periodtype(label, days)
 
         cursor = conn.execute("""
                 SELECT HabitName, periodtypeID, IsActive
@@ -320,6 +539,11 @@ def edit_habit(habit_id, habit_name, period_str, is_active):
                     WHERE habitID = ?
                 """,(habit_id,))
 
+            conn.execute("""
+                    DELETE FROM habit_streaks
+                    WHERE habitID = ?
+                """,(habit_id,))
+
         else:
             # Only status changed (archive/unarchive)
             conn.execute("""
@@ -339,20 +563,23 @@ def delete_habit(habit_id):
     Parameters:
     - habit_id: integer, ID of the habit
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    with _pool.connection() as conn:
         cursor = conn.cursor()
 
         cursor.execute("""
                 DELETE FROM activities 
                 WHERE habitID = ?
             """, (habit_id,))
+
+        cursor.execute("""
+                DELETE FROM habit_streaks
+                WHERE habitID = ?
+            """, (habit_id,))
         
         cursor.execute("""
                     DELETE FROM habits 
                     WHERE habitID = ?
                 """, (habit_id,))
-        
-        conn.commit()
 
 
 def get_habit(habit_id):
@@ -362,9 +589,7 @@ def get_habit(habit_id):
     Parameters:
     - habit_id: integer, ID of the habit
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-
+    with _pool.connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT 
@@ -387,37 +612,82 @@ def get_habit(habit_id):
         return dict(row) if row else None
 
 
-def get_active_habits(user_id):
+# columns get_habits can return, key: column name, value: sql expression
+HABIT_COLUMNS = {
+    "habitID": "h.habitID",
+    "userID": "h.userID",
+    "HabitName": "h.HabitName",
+    "periodtypeID": "h.periodtypeID",
+    "DateCreated": "h.DateCreated",
+    "LastChecked": "h.LastChecked",
+    "IsActive": "h.IsActive",
+    "Periodtype": "pt.Periodtype",
+    "EqualsToDays": "pt.EqualsToDays",
+    "BestStreak": "COALESCE(s.BestStreak, 0)",
+}
+
+# the columns a Habit object is built from
+DEFAULT_HABIT_COLUMNS = ("habitID", "userID", "HabitName", "periodtypeID", "DateCreated", "LastChecked", "IsActive", "Periodtype", "EqualsToDays")
+
+# distinct check days of the habit, read from the covering habitID / ActivityDay index in ascending order
+_CHECKS_SQL = "(SELECT group_concat(DISTINCT a.ActivityDay) FROM activities a WHERE a.habitID = h.habitID) AS checks"
+
+
+def get_habits(user_id, status=None, columns=DEFAULT_HABIT_COLUMNS, with_checks=False):
     """
-    Return all habit rows joined with periodtypes
-    so a Habit object can be built
+    Get the habits of a user with one query, active habits first, each group in the order they were created
+    returns a list of dictionaries with the requested columns
 
     Parameters:
     - user_id: integer, ID of the current user
+    - status: string, active or archived, None for all habits
+    - columns: list, names of HABIT_COLUMNS to return
+    - with_checks: boolean, adds the key checks: ascending int array of the distinct check days of every habit,
+      read in the same query instead of one query per habit
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
+    unknown = set(columns) - set(HABIT_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown habit columns: {sorted(unknown)}")
+    if status not in (None, "active", "archived"):
+        raise ValueError(f"unknown habit status: {status}")
 
-        cursor = conn.cursor()
+    select = [f"{HABIT_COLUMNS[c]} AS {c}" for c in columns]
+    if with_checks:
+        select.append(_CHECKS_SQL)
 
-        cursor.execute("""
+    # the streak state is only joined when the record streak is requested
+    streaks = "LEFT JOIN habit_streaks s ON s.habitID = h.habitID" if "BestStreak" in columns else ""
+
+    with _pool.connection() as conn:
+        cursor = conn.execute(f"""
             SELECT
-                h.habitID,
-                h.userID,
-                h.HabitName,
-                h.periodtypeID,
-                h.DateCreated,
-                h.LastChecked,
-                h.IsActive,
-                pt.Periodtype,
-                pt.EqualsToDays
+                {", ".join(select)}
             FROM habits h
             JOIN periodtypes pt ON h.periodtypeID = pt.periodtypeID
-            WHERE h.userID = ? AND h.IsActive = 1
-            ORDER BY h.DateCreated, h.habitID
-        """, (user_id,))
+            {streaks}
+            WHERE h.userID = :user_id
+                AND (:is_active IS NULL OR h.IsActive = :is_active)
+            ORDER BY h.IsActive DESC, h.DateCreated, h.habitID
+        """, {"user_id": user_id, "is_active": {"active": 1, "archived": 0}.get(status)})
+
+        rows = [dict(r) for r in cursor.fetchall()]
+
+    if with_checks:
+        for r in rows:
+            r["checks"] = array("i", sorted(map(int, r["checks"].split(",")))) if r["checks"] else array("i")
+
+    return rows
+
 
-        return [dict(r) for r in cursor.fetchall()]
+def get_active_habits(user_id):
+    """
+    Return all active habit rows joined with periodtypes
+    so a Habit object can be built
+
+    Parameters:
+    - user_id: integer, ID of the current user
+    """
+    return get_habits(user_id, status="active")
 
 
 def get_archived_habits(user_id):
@@ -427,11 +697,46 @@ def get_archived_habits(user_id):
     Parameters:
     - user_id: integer, ID of the current user
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        
-        cursor = conn.cursor()
-        cursor.execute("""
+    return get_habits(user_id, status="archived")
+
+
+# sortable columns of the habit table on the edit screen, key: name in the UI, value: sql expression
+HABIT_SORT_COLUMNS = {
+    "name": "h.HabitName COLLATE NOCASE",
+    "period": "pt.EqualsToDays",
+    "status": "h.IsActive",
+    "created": "h.DateCreated",
+    "last_checked": "h.LastChecked",
+}
+
+STANDARD_PERIODS = ("Daily", "Weekly", "Monthly", "Yearly") # all other periods are custom ones ('every n days')
+_STANDARD_PERIODS_SQL = ", ".join(f"'{p}'" for p in STANDARD_PERIODS) # sql list of the labels, for the custom filter
+
+
+def get_habits_page(user_id, search="", period=None, is_active=None, sort="created", descending=False, offset=0, limit=10):
+    """
+    Get one page of the habits of a user for the habit table, filtered and sorted in the database
+    returns a tuple: the habit rows of the page and the number of habits matching the filters
+
+    Parameters:
+    - user_id: integer, ID of the current user
+    - search: str, part of the habit name, case-insensitive
+    - period: str, Daily, Weekly, Monthly, Yearly or Custom (all 'every n days' periods), None for all periods
+    - is_active: integer, 1 for the active, 0 for the archived habits, None for both
+    - sort: str, key of HABIT_SORT_COLUMNS
+    - descending: boolean, sort direction
+    - offset: integer, number of habits before the page
+    - limit: integer, number of habits on the page
+    """
+    if sort not in HABIT_SORT_COLUMNS:
+        raise ValueError(f"unknown sort column: {sort}")
+
+    direction = "DESC" if descending else "ASC"
+    pattern = "%" + re.sub(r"([\\%_])", r"\\\1", search or "") + "%" # wildcards in the search are matched literally
+
+    with _pool.connection() as conn:
+        # the filters are part of one statement, so there is one statement per sort order
+        rows = conn.execute(f"""
             SELECT
                 h.habitID,
                 h.userID,
@@ -441,68 +746,369 @@ def get_archived_habits(user_id):
                 h.LastChecked,
                 h.IsActive,
                 pt.Periodtype,
-                pt.EqualsToDays
+                pt.EqualsToDays,
+                COUNT(*) OVER () AS total
             FROM habits h
             JOIN periodtypes pt ON h.periodtypeID = pt.periodtypeID
-            WHERE h.userID = ? AND h.IsActive = 0
-            ORDER BY h.DateCreated, h.habitID
-        """, (user_id,))
+            WHERE h.userID = :user_id
+                AND h.HabitName LIKE :pattern ESCAPE '\\'
+                AND (:is_active IS NULL OR h.IsActive = :is_active)
+                AND (:period IS NULL OR pt.Periodtype = :period
+                     OR (:period = 'Custom' AND pt.Periodtype NOT IN ({_STANDARD_PERIODS_SQL})))
+            ORDER BY {HABIT_SORT_COLUMNS[sort]} {direction}, h.habitID {direction}
+            LIMIT :limit OFFSET :offset
+        """, {"user_id": user_id, "pattern": pattern, "is_active": is_active, "period": period,
+              "limit": limit, "offset": offset}).fetchall()
+
+    if not rows:
+        return [], 0
 
-        return [dict(r) for r in cursor.fetchall()]
+    total = rows[0]["total"]
+    return [{k: r[k] for k in r.keys() if k != "total"} for r in rows], total
 
 
 def mark_habit_as_checked(habit_id):
     """
     Records a completion/check for 'now' and updates LastChecked on the habit
+    wrapper around mark_habits_as_checked for a single habit, raises when the check could not be written
     
     Parameters:
     - habit_id: integer, ID of the selected habit
     """
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    errors = mark_habits_as_checked([habit_id])
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
+    if errors:
+        raise ValueError(errors[0][1])
 
-        cursor.execute("""
-            INSERT INTO activities (habitID, ActivityDate)
-            VALUES (?, ?)
-        """, (habit_id, now))
 
-        cursor.execute("""
+def mark_habits_as_checked(habit_ids, when=None):
+    """
+    Records a completion/check for several habits and updates LastChecked and the streak state of each of them
+    everything is written in one transaction, so a bulk check costs a single commit
+    returns a list of (habit_id, error message) for the habits which could not be checked
+    
+    Parameters:
+    - habit_ids: list, IDs of the selected habits
+    - when: datetime, time of the check, defaults to now
+    """
+    when = when or datetime.now()
+    stamp = when.strftime("%Y-%m-%d %H:%M:%S")
+    day = _day_number(when)
+
+    ids = list(dict.fromkeys(int(hid) for hid in habit_ids)) # drop duplicates, keep the order
+    if not ids:
+        return []
+
+    with _pool.connection() as conn:
+        cursor = conn.cursor()
+
+        existing = {}
+        already_checked = set()
+        for id_sql, params in _id_lists(conn, ids):
+            cursor.execute(f"""
+                SELECT
+                    h.habitID,
+                    pt.EqualsToDays,
+                    COALESCE(s.CurrentStreak, 0) AS CurrentStreak,
+                    COALESCE(s.BestStreak, 0) AS BestStreak,
+                    s.RunStartDay,
+                    s.LastCheckDay
+                FROM habits h
+                JOIN periodtypes pt ON h.periodtypeID = pt.periodtypeID
+                LEFT JOIN habit_streaks s ON s.habitID = h.habitID
+                WHERE h.habitID IN ({id_sql})
+            """, params)
+            existing.update((row["habitID"], row) for row in cursor.fetchall())
+
+            # UNIQUE(habitID, ActivityDate) would reject these and abort the whole batch
+            cursor.execute(f"""
+                SELECT habitID
+                FROM activities
+                WHERE ActivityDate = ? AND habitID IN ({id_sql})
+            """, [stamp, *params])
+            already_checked.update(row["habitID"] for row in cursor.fetchall())
+
+        errors = []
+        to_check = []
+        for hid in ids:
+            if hid not in existing:
+                errors.append((hid, f"Habit {hid} not found"))
+            elif hid in already_checked:
+                errors.append((hid, f"Habit {hid} is already checked at {stamp}"))
+            else:
+                to_check.append(hid)
+
+        cursor.executemany("""
+            INSERT INTO activities (habitID, ActivityDate, ActivityDay)
+            VALUES (?, ?, ?)
+        """, [(hid, stamp, day) for hid in to_check])
+
+        # a check in the past (when) must not move LastChecked backwards
+        cursor.executemany("""
             UPDATE habits
             SET LastChecked = ?
-            WHERE habitID = ?
-        """, (now, habit_id))
+            WHERE habitID = ? AND (LastChecked IS NULL OR LastChecked < ?)
+        """, [(stamp, hid, stamp) for hid in to_check])
+
+        # advance the streak state in O(1), only a check before the last check day needs a replay
+        states = []
+        replay = []
+        for hid in to_check:
+            row = existing[hid]
+            if row["LastCheckDay"] is not None and day < row["LastCheckDay"]:
+                replay.append(hid)
+                continue
+            old = (row["CurrentStreak"], row["BestStreak"], row["RunStartDay"], row["LastCheckDay"])
+            states.append((hid, *_advance_streak(old, day, int(row["EqualsToDays"]))))
 
-        conn.commit()
+        cursor.executemany("""
+            INSERT OR REPLACE INTO habit_streaks (habitID, CurrentStreak, BestStreak, RunStartDay, LastCheckDay)
+            VALUES (?, ?, ?, ?, ?)
+        """, states)
+
+        if replay:
+            rebuild_streak_states(replay)
+
+        return errors
 
 
 def get_checks_for_habits(habit_id_list):
     """
-    Get all checks for a habit
+    Get all check days for several habits
+    returns a compact, ascending int array of distinct day numbers (days since 1970-01-01) per habit,
+    read from the habitID / ActivityDay index without touching the date strings
     
     Parameters:
     - habit_id_list: list, array of various habit ids for which the checks need to be known
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
+    with _pool.connection() as conn:
         cursor = conn.cursor()
 
-        cursor.execute(
-            f"""
-            SELECT 
-                habitID, 
-                DATE(ActivityDate) AS date
-            FROM activities
-            WHERE habitID IN ({",".join(["?"] * len(habit_id_list))})
-            GROUP BY habitID, date
-            ORDER BY habitID, date DESC
-            """,
-            habit_id_list,
-        )
-
-        out = defaultdict(list)
-        for row in cursor.fetchall():
-            out[row["habitID"]].append(row["date"])
-
-        return {hid: out.get(hid, []) for hid in habit_id_list}
\ No newline at end of file
+        # chunks are in ascending id order, so the rows stay ordered by habitID, ActivityDay over all of them
+        out = defaultdict(lambda: array("i"))
+        for id_sql, params in _id_lists(conn, habit_id_list):
+            cursor.execute(
+                f"""
+                SELECT DISTINCT
+                    habitID,
+                    ActivityDay
+                FROM activities
+                WHERE habitID IN ({id_sql})
+                ORDER BY habitID, ActivityDay
+                """,
+                params,
+            )
+            for hid, day in cursor.fetchall():
+                out[hid].append(day)
+
+        return {hid: out.get(hid, array("i")) for hid in habit_id_list}
+
+
+def _aggregate_rows(cursor):
+    """
+    helper function, turns the rows of an aggregate query into a dictionary per habit
+    the first and last check are returned as dates
+
+    Parameters:
+    - cursor: sqlite cursor with executed aggregate query
+    """
+    return {
+        r["habitID"]: {
+            "check_count": r["check_count"],
+            "active_days": r["active_days"],
+            "first_check": EPOCH + timedelta(days=r["first_day"]),
+            "last_check": EPOCH + timedelta(days=r["last_day"]),
+        }
+        for r in cursor.fetchall()
+    }
+
+
+# per habit aggregates, only reads the covering habitID / ActivityDay index
+_AGGREGATE_SQL = """
+    SELECT
+        a.habitID,
+        COUNT(*) AS check_count,
+        COUNT(DISTINCT a.ActivityDay) AS active_days,
+        MIN(a.ActivityDay) AS first_day,
+        MAX(a.ActivityDay) AS last_day
+    FROM activities a
+    WHERE a.habitID IN ({habits})
+    GROUP BY a.habitID
+"""
+
+
+def get_habit_aggregates(user_id):
+    """
+    Get the number of checks, the number of distinct days with a check and the first and last check day
+    of every habit of a user, counted by the database instead of reading every activity
+    habits without checks are not in the result
+
+    Parameters:
+    - user_id: integer, ID of the current user
+    """
+    with _pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_AGGREGATE_SQL.format(habits="SELECT habitID FROM habits WHERE userID = ?"), (user_id,))
+
+        return _aggregate_rows(cursor)
+
+
+def get_user_habit_data(user_id):
+    """
+    Get everything the analytics tables need for one user with two queries on one connection:
+    all habits (active + archived) with their period and record streak, and the aggregates of their checks
+    returns a tuple (habit rows, dict key: habit_id, value: aggregates like get_habit_aggregates)
+
+    Parameters:
+    - user_id: integer, ID of the current user
+    """
+    with _pool.connection() as conn:
+        # all habits on the same connection, active habits first
+        habits = get_habits(user_id, columns=DEFAULT_HABIT_COLUMNS + ("BestStreak",))
+
+        cursor = conn.cursor()
+        cursor.execute(_AGGREGATE_SQL.format(habits="SELECT habitID FROM habits WHERE userID = ?"), (user_id,))
+
+        return habits, _aggregate_rows(cursor)
+
+
+# columns of the rows iter_activity_log yields
+ACTIVITY_LOG_COLUMNS = ["activityID", "habitID", "HabitName", "ActivityDate", "ActivityDay"]
+
+
+def iter_activity_log(user_id, chunk_size=5000):
+    """
+    Yields all checks of a user in chunks of at most chunk_size rows, ordered by habit and check date
+    every chunk is read with its own short borrow of the connection (keyset pagination along the
+    habitID / ActivityDate index), so a long export never holds a transaction open between two chunks
+
+    Parameters:
+    - user_id: integer, ID of the current user
+    - chunk_size: integer, maximum number of rows per chunk
+    """
+    with _pool.connection() as conn:
+        habits = conn.execute("""
+            SELECT habitID, HabitName
+            FROM habits
+            WHERE userID = ?
+            ORDER BY habitID
+        """, (user_id,)).fetchall()
+
+    for habit_id, habit_name in habits:
+        last = "" # ActivityDate is unique per habit, so it is enough as keyset
+        while True:
+            with _pool.connection() as conn:
+                rows = conn.execute("""
+                    SELECT
+                        activityID,
+                        ActivityDate,
+                        ActivityDay
+                    FROM activities
+                    WHERE habitID = ? AND ActivityDate > ?
+                    ORDER BY ActivityDate
+                    LIMIT ?
+                """, (habit_id, last, chunk_size)).fetchall()
+
+            if not rows:
+                break
+
+            yield [(r["activityID"], habit_id, habit_name, r["ActivityDate"], r["ActivityDay"]) for r in rows]
+            last = rows[-1]["ActivityDate"]
+
+
+# ------------ streak state -------------
+
+def get_streak_states(habit_id_list):
+    """
+    Get the stored streak state of several habits, habits without checks get an empty state
+    the current streak is the length of the run up to the last check, see Habit.current_from_state
+    for the streak as it is shown today
+    
+    Parameters:
+    - habit_id_list: list, array of various habit ids
+    """
+    if not habit_id_list:
+        return {}
+
+    with _pool.connection() as conn:
+        cursor = conn.cursor()
+
+        states = {}
+        for id_sql, params in _id_lists(conn, habit_id_list):
+            cursor.execute(
+                f"""
+                SELECT
+                    h.habitID,
+                    pt.EqualsToDays,
+                    COALESCE(s.CurrentStreak, 0) AS CurrentStreak,
+                    COALESCE(s.BestStreak, 0) AS BestStreak,
+                    s.RunStartDay,
+                    s.LastCheckDay
+                FROM habits h
+                JOIN periodtypes pt ON h.periodtypeID = pt.periodtypeID
+                LEFT JOIN habit_streaks s ON s.habitID = h.habitID
+                WHERE h.habitID IN ({id_sql})
+                """,
+                params,
+            )
+            states.update((row["habitID"], dict(row)) for row in cursor.fetchall())
+
+        return states
+
+
+def rebuild_streak_states(habit_id_list=None):
+    """
+    Recomputes the streak state from the activities to reconcile any drift,
+    e.g. after activities were written without mark_habits_as_checked
+    returns the number of rebuilt habits
+    
+    Parameters:
+    - habit_id_list: list, habit ids to rebuild, all habits when None
+    """
+    with _pool.connection() as conn:
+        cursor = conn.cursor()
+
+        if habit_id_list is None:
+            cursor.execute("""
+                SELECT h.habitID, h.userID, pt.EqualsToDays
+                FROM habits h
+                JOIN periodtypes pt ON h.periodtypeID = pt.periodtypeID
+            """)
+            rows = cursor.fetchall()
+        else:
+            rows = []
+            for id_sql, params in _id_lists(conn, habit_id_list):
+                cursor.execute(f"""
+                    SELECT h.habitID, h.userID, pt.EqualsToDays
+                    FROM habits h
+                    JOIN periodtypes pt ON h.periodtypeID = pt.periodtypeID
+                    WHERE h.habitID IN ({id_sql})
+                """, params)
+                rows.extend(cursor.fetchall())
+        equal_days = {row["habitID"]: int(row["EqualsToDays"]) for row in rows}
+
+        if not equal_days:
+            return 0
+
+        days = get_checks_for_habits(list(equal_days))
+
+        states = []
+        for hid, e in equal_days.items():
+            state = (0, 0, None, None)
+            for day in days[hid]:
+                state = _advance_streak(state, day, e)
+            states.append((hid, *state))
+
+        cursor.executemany("""
+            INSERT OR REPLACE INTO habit_streaks (habitID, CurrentStreak, BestStreak, RunStartDay, LastCheckDay)
+            VALUES (?, ?, ?, ?, ?)
+        """, states)
+
+        # habit_streaks has no DataVersion triggers, cached results of the users would keep the old state
+        cursor.executemany("""
+            UPDATE user
+            SET DataVersion = DataVersion + 1
+            WHERE userID = ?
+        """, [(uid,) for uid in sorted({row["userID"] for row in rows})])
+
+        return len(states)
\ No newline at end of file
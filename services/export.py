@@ -0,0 +1,252 @@
+"""
+Script handles the file exports of the analytics screen
+Large exports are written chunk by chunk, so the memory stays flat and the first bytes reach the browser early
+The parquet exports keep the types of the columns (int32 ids, dates, categorical names) for further analysis in other tools
+"""
+import csv
+import io
+import zipfile
+import numpy as np
+import pandas as pd
+
+# pyarrow is optional, without it the parquet downloads are disabled
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+def csv_chunks(columns, row_chunks):
+    """
+    yields a csv file as utf-8 encoded chunks: the header first, then one chunk per list of rows
+
+    Parameters:
+    - columns: list, names of the columns for the header
+    - row_chunks: iterable, yields lists of row tuples in the order of the columns
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n") # the same line ending as DataFrame.to_csv
+
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+
+    for rows in row_chunks:
+        buffer.seek(0)
+        buffer.truncate()
+
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkStream(io.RawIOBase):
+    """
+    write-only stream which collects the written bytes until they are taken,
+    it can't seek or tell, so zipfile writes the sizes of the files after their data
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_chunks(files):
+    """
+    yields a zip archive as chunks, every file is compressed and passed on as soon as it is written,
+    so the archive is never held in memory as a whole
+
+    Parameters:
+    - files: iterable, yields (file name, bytes or iterable of bytes chunks) for every file of the archive
+    """
+    stream = _ChunkStream()
+
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files:
+            with archive.open(name, "w") as f:
+                for chunk in ([content] if isinstance(content, bytes) else content):
+                    f.write(chunk)
+            yield stream.take()
+
+    # the central directory is written when the archive is closed
+    yield stream.take()
+
+
+# ------------------ columnar exports -------------------
+# datasets of the parquet download, key: file name, value: label in the UI
+COLUMNAR_DATASETS = {
+    "activities": "Activities",
+    "habits": "Habits",
+    "streak_history": "Streak history",
+}
+
+
+def columnar_available():
+    """
+    returns True when pyarrow is installed and the parquet exports can be written
+    """
+    return pa is not None
+
+
+def _timestamps(values):
+    """
+    helper function to convert timestamp strings of the database to an arrow timestamp column (seconds)
+
+    Parameters:
+    - values: list, timestamp strings or None
+    """
+    parsed = pd.to_datetime(pd.Series(values, dtype="object"), format="ISO8601")
+    return pa.array(parsed).cast(pa.timestamp("s"), safe=False)
+
+
+def _names(values):
+    """
+    helper function for categorical text columns, every distinct name is only stored once
+
+    Parameters:
+    - values: list, strings of the column
+    """
+    return pa.array(values, type=pa.string()).dictionary_encode()
+
+
+def _write_parquet(batches):
+    """
+    writes record batches into one parquet file, every batch becomes its own row group
+    returns the file as bytes, None when there was no batch
+
+    Parameters:
+    - batches: iterable, yields pyarrow record batches with the same schema
+    """
+    sink = pa.BufferOutputStream()
+    writer = None
+
+    for batch in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(sink, batch.schema)
+        writer.write_batch(batch)
+
+    if writer is None:
+        return None
+
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+def _empty_parquet(schema):
+    """
+    returns a parquet file without rows, but with the columns and types of the schema
+
+    Parameters:
+    - schema: pyarrow schema of the dataset
+    """
+    sink = pa.BufferOutputStream()
+    pq.write_table(schema.empty_table(), sink)
+    return sink.getvalue().to_pybytes()
+
+
+ACTIVITIES_SCHEMA = pa.schema([
+    ("activityID", pa.int32()),
+    ("habitID", pa.int32()),
+    ("HabitName", pa.dictionary(pa.int32(), pa.string())),
+    ("ActivityDate", pa.timestamp("s")),
+    ("date", pa.date32()),
+]) if pa else None
+
+
+def activities_parquet(row_chunks):
+    """
+    returns the activity log as parquet file, the chunks of iter_activity_log are converted one by one
+
+    Parameters:
+    - row_chunks: iterable, yields lists of (activityID, habitID, HabitName, ActivityDate, ActivityDay) rows
+    """
+    def batches():
+        for rows in row_chunks:
+            activity_ids, habit_ids, names, stamps, days = zip(*rows)
+            yield pa.record_batch([
+                pa.array(activity_ids, type=pa.int32()),
+                pa.array(habit_ids, type=pa.int32()),
+                _names(names),
+                _timestamps(stamps),
+                pa.array(days, type=pa.int32()).cast(pa.date32()), # day numbers are the storage of date32
+            ], schema=ACTIVITIES_SCHEMA)
+
+    return _write_parquet(batches()) or _empty_parquet(ACTIVITIES_SCHEMA)
+
+
+HABITS_SCHEMA = pa.schema([
+    ("habitID", pa.int32()),
+    ("userID", pa.int32()),
+    ("HabitName", pa.string()),
+    ("Periodtype", pa.dictionary(pa.int32(), pa.string())),
+    ("EqualsToDays", pa.int32()),
+    ("IsActive", pa.bool_()),
+    ("DateCreated", pa.timestamp("s")),
+    ("LastChecked", pa.timestamp("s")),
+    ("check_count", pa.int32()),
+    ("record_streak", pa.int32()),
+]) if pa else None
+
+
+def habits_parquet(snapshot):
+    """
+    returns all habits of the analytics snapshot with their number of checks and record streak as parquet file
+
+    Parameters:
+    - snapshot: AnalyticsSnapshot of the user
+    """
+    habits = snapshot.habits
+    if not habits:
+        return _empty_parquet(HABITS_SCHEMA)
+
+    batch = pa.record_batch([
+        pa.array([h["habitID"] for h in habits], type=pa.int32()),
+        pa.array([h["userID"] for h in habits], type=pa.int32()),
+        pa.array([h["HabitName"] for h in habits], type=pa.string()),
+        _names([h["Periodtype"] for h in habits]),
+        pa.array([h["EqualsToDays"] for h in habits], type=pa.int32()),
+        pa.array([bool(h["IsActive"]) for h in habits], type=pa.bool_()),
+        _timestamps([h["DateCreated"] for h in habits]),
+        _timestamps([h["LastChecked"] for h in habits]),
+        pa.array([snapshot.check_count(h["habitID"]) for h in habits], type=pa.int32()),
+        pa.array([snapshot.records.get(h["habitID"], 0) for h in habits], type=pa.int32()),
+    ], schema=HABITS_SCHEMA)
+
+    return _write_parquet([batch])
+
+
+STREAK_HISTORY_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("habitID", pa.int32()),
+    ("HabitName", pa.dictionary(pa.int32(), pa.string())),
+    ("streak", pa.int32()),
+]) if pa else None
+
+
+def streak_history_parquet(series):
+    """
+    returns the daily streak history as parquet file, one row group per habit
+
+    Parameters:
+    - series: iterable, yields (habit, days as datetime64[D], streaks) like habit_series in streak_history.py
+    """
+    def batches():
+        for habit, dates, streaks in series:
+            n = len(dates)
+            yield pa.record_batch([
+                pa.array(dates, type=pa.date32()),
+                pa.array(np.full(n, habit["habitID"], dtype=np.int32)),
+                pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32), pa.array([habit["HabitName"]])),
+                pa.array(streaks, type=pa.int32()),
+            ], schema=STREAK_HISTORY_SCHEMA)
+
+    return _write_parquet(batches()) or _empty_parquet(STREAK_HISTORY_SCHEMA)
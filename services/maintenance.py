@@ -0,0 +1,42 @@
+"""
+Script handles maintenance commands for the database
+Run it from the project folder, e.g.:
+- python -m services.maintenance migrate --dry-run
+- python -m services.maintenance rebuild-streaks
+"""
+import argparse
+
+from services.database import setup_database, migrate, rebuild_streak_states
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintenance commands for the habit tracker database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser(
+        "rebuild-streaks",
+        help="recompute the stored streak state from the activities to reconcile any drift"
+    )
+    rebuild.add_argument("--habit", type=int, action="append", dest="habit_ids",
+                         help="only rebuild this habit ID (can be repeated), default: all habits")
+
+    upgrade = commands.add_parser(
+        "migrate",
+        help="apply the pending schema migrations (the app does this on startup as well)"
+    )
+    upgrade.add_argument("--dry-run", action="store_true", help="only list the pending migrations")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        version = migrate(dry_run=args.dry_run)
+        print(f"[OK] Schema version {version}.")
+
+    elif args.command == "rebuild-streaks":
+        setup_database()
+        n = rebuild_streak_states(args.habit_ids)
+        print(f"[OK] Rebuilt the streak state of {n} habit(s).")
+
+
+if __name__ == "__main__":
+    main()
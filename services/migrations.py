@@ -0,0 +1,296 @@
+"""
+Script handles the versioned schema migrations of the database
+The schema version of a database file is stored in PRAGMA user_version,
+every migration step raises it by one after it has finished
+
+Steps are idempotent (IF NOT EXISTS, only rows which are not migrated yet), because backfills
+commit after every chunk - a step that was interrupted simply continues on the next start
+"""
+from time import perf_counter
+
+# sqlite expression for the day number (days since 1970-01-01) of an activity
+DAY_NUMBER_SQL = "CAST(julianday(DATE(ActivityDate)) - 2440587.5 AS INTEGER)"
+
+MIGRATIONS = [] # list of (version, description, step function), ordered by version
+
+
+def migration(version, description):
+    """
+    decorator to register a migration step
+
+    Parameters:
+    - version: integer, schema version after the step
+    - description: string, short text for the log and the dry run
+    """
+    def register(step):
+        if MIGRATIONS and version != MIGRATIONS[-1][0] + 1:
+            raise ValueError(f"Migration {version} is out of order")
+        MIGRATIONS.append((version, description, step))
+        return step
+    return register
+
+
+def _id_chunks(conn, table, id_column, chunk_size, where="1"):
+    """
+    yields (first id, last id) ranges with at most chunk_size rows each,
+    walking along the primary key so every chunk is a cheap range scan
+
+    Parameters:
+    - conn: sqlite connection
+    - table: string, name of the table
+    - id_column: string, integer primary key of the table
+    - chunk_size: integer, maximum number of rows per chunk
+    - where: string, optional filter for the rows
+    """
+    last = 0
+    while True:
+        row = conn.execute(f"""
+            SELECT MIN({id_column}), MAX({id_column})
+            FROM (
+                SELECT {id_column}
+                FROM {table}
+                WHERE {id_column} > ? AND {where}
+                ORDER BY {id_column}
+                LIMIT ?
+            )
+        """, (last, chunk_size)).fetchone()
+
+        if row[0] is None:
+            return
+        yield row[0], row[1]
+        last = row[1]
+
+
+# ------------------ migration steps -------------------
+
+@migration(1, "create user, habits, periodtypes and activities tables with their indices")
+def _base_schema(conn, chunk_size):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user (
+            userID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Username TEXT UNIQUE NOT NULL,
+            DateCreated TIMESTAMP DEFAULT (datetime('now','localtime'))
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS habits (
+            habitID INTEGER PRIMARY KEY AUTOINCREMENT,
+            userID INTEGER NOT NULL,
+            periodtypeID INTEGER NOT NULL,
+            HabitName TEXT NOT NULL,
+            DateCreated TIMESTAMP DEFAULT (datetime('now','localtime')),
+            LastChecked TIMESTAMP,
+            IsActive BOOLEAN DEFAULT 1,
+            FOREIGN KEY (userID) REFERENCES user(userID),
+            FOREIGN KEY (periodtypeID) REFERENCES periodtypes(periodtypeID),
+            UNIQUE(userID, HabitName)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS periodtypes (
+            periodtypeID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Periodtype TEXT UNIQUE NOT NULL,
+            EqualsToDays INTEGER NOT NULL
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activities (
+            activityID INTEGER PRIMARY KEY AUTOINCREMENT,
+            habitID INTEGER NOT NULL,
+            ActivityDate TIMESTAMP DEFAULT (datetime('now','localtime')),
+            FOREIGN KEY (habitID) REFERENCES habits(habitID),
+            UNIQUE(habitID, ActivityDate)
+        )
+    """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_user_active ON habits(userID, IsActive)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_periodtype ON habits(periodtypeID)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_periodtypes_eqdays ON periodtypes(EqualsToDays)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activities_habit_date ON activities(habitID, ActivityDate)")
+
+
+@migration(2, "create habit_streaks table for the incrementally maintained streak state")
+def _streak_state_table(conn, chunk_size):
+    # days are stored as day numbers (days since 1970-01-01)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS habit_streaks (
+            habitID INTEGER PRIMARY KEY,
+            CurrentStreak INTEGER NOT NULL DEFAULT 0,
+            BestStreak INTEGER NOT NULL DEFAULT 0,
+            RunStartDay INTEGER,
+            LastCheckDay INTEGER,
+            FOREIGN KEY (habitID) REFERENCES habits(habitID)
+        )
+    """)
+
+
+@migration(3, "add activities.ActivityDay day number column, backfill it and index it")
+def _activity_day(conn, chunk_size):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(activities)")}
+    if "ActivityDay" not in columns:
+        conn.execute("ALTER TABLE activities ADD COLUMN ActivityDay INTEGER")
+
+    # keeps the column in sync for inserts which don't set it, e.g. tests/insert_data_db.py
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_activities_day
+        AFTER INSERT ON activities
+        WHEN NEW.ActivityDay IS NULL
+        BEGIN
+            UPDATE activities
+            SET ActivityDay = {DAY_NUMBER_SQL.replace("ActivityDate", "NEW.ActivityDate")}
+            WHERE activityID = NEW.activityID;
+        END
+    """)
+    conn.commit()
+
+    # backfill in chunks, every chunk is its own short write transaction
+    for first, last in _id_chunks(conn, "activities", "activityID", chunk_size):
+        conn.execute(f"""
+            UPDATE activities
+            SET ActivityDay = {DAY_NUMBER_SQL}
+            WHERE activityID BETWEEN ? AND ? AND ActivityDay IS NULL
+        """, (first, last))
+        conn.commit()
+
+    # covering index for the check days of a habit
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activities_habit_day ON activities(habitID, ActivityDay)")
+
+
+def _replay_streak_v4(days, equal_days):
+    """
+    helper function, the streak state of schema version 4 replayed from the sorted, distinct check days of a habit
+    returns (current, best, run start day, last check day), kept here so later changes of the
+    database layer can't change what this migration writes
+
+    Parameters:
+    - days: list, ascending day numbers of the checks
+    - equal_days: integer, the value in days for the habit
+    """
+    current, best, run_start, last = 0, 0, None, None
+    for day in days:
+        if equal_days < 1:
+            current, best, run_start = 0, 0, None
+        elif last is None or day - last > equal_days:
+            current, run_start = 1, day
+        else:
+            current += 1
+        best = max(best, current)
+        last = day
+    return current, best, run_start, last
+
+
+@migration(4, "build the streak state of habits with activities")
+def _streak_state_backfill(conn, chunk_size):
+    where = "habitID NOT IN (SELECT habitID FROM habit_streaks)"
+
+    # the replay reads all checks of a habit, so the chunks are counted in habits, not in activities
+    habit_chunk = max(1, chunk_size // 100)
+    for first, last in _id_chunks(conn, "habits", "habitID", habit_chunk, where=where):
+        equal_days = {hid: int(e) for hid, e in conn.execute(f"""
+            SELECT h.habitID, pt.EqualsToDays
+            FROM habits h
+            JOIN periodtypes pt ON h.periodtypeID = pt.periodtypeID
+            WHERE h.habitID BETWEEN ? AND ? AND h.{where}
+        """, (first, last))}
+
+        days = {hid: [] for hid in equal_days}
+        for hid, day in conn.execute("""
+            SELECT DISTINCT habitID, ActivityDay
+            FROM activities
+            WHERE habitID BETWEEN ? AND ?
+            ORDER BY habitID, ActivityDay
+        """, (first, last)):
+            if hid in days:
+                days[hid].append(day)
+
+        conn.executemany("""
+            INSERT OR REPLACE INTO habit_streaks (habitID, CurrentStreak, BestStreak, RunStartDay, LastCheckDay)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(hid, *_replay_streak_v4(days[hid], e)) for hid, e in equal_days.items()])
+        conn.commit()
+
+
+@migration(5, "add user.DataVersion write counter and the triggers which increase it")
+def _data_version(conn, chunk_size):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(user)")}
+    if "DataVersion" not in columns:
+        conn.execute("ALTER TABLE user ADD COLUMN DataVersion INTEGER NOT NULL DEFAULT 0")
+
+    # every write to the habits or activities of a user increases the counter,
+    # cached results of the user (services/cache.py) are keyed by it and become stale automatically
+    bump = "UPDATE user SET DataVersion = DataVersion + 1 WHERE userID = {user}"
+    habit_user = "(SELECT userID FROM habits WHERE habitID = {row}.habitID)"
+
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_habits_version_{event.lower()}
+            AFTER {event} ON habits
+            BEGIN
+                {bump.format(user=f"{row}.userID")};
+            END
+        """)
+
+    for event, row in (("INSERT", "NEW"), ("DELETE", "OLD")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_activities_version_{event.lower()}
+            AFTER {event} ON activities
+            BEGIN
+                {bump.format(user=habit_user.format(row=row))};
+            END
+        """)
+
+
+
+@migration(6, "add a case-insensitive username index for the searchable user list")
+def _username_index(conn, chunk_size):
+    # the user list is sorted and searched by this index (services/database.py, get_users_page),
+    # the rowid (userID) is part of every index entry, so the keyset (Username, userID) is covered as well
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_name_nocase ON user(Username COLLATE NOCASE)")
+
+# ------------------ runner -------------------
+
+def schema_version(conn):
+    """
+    returns the schema version of the database
+
+    Parameters:
+    - conn: sqlite connection
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn, dry_run=False, chunk_size=50_000, log=print):
+    """
+    applies all migration steps newer than the schema version of the database in order
+    and logs the time every step took, returns the schema version afterwards
+
+    Parameters:
+    - conn: sqlite connection
+    - dry_run: boolean, only log the pending steps without changing the database
+    - chunk_size: integer, rows per transaction for backfills
+    - log: function, receives one line of output per step
+    """
+    current = schema_version(conn)
+    pending = [m for m in MIGRATIONS if m[0] > current]
+
+    if dry_run:
+        if not pending:
+            log(f"[DRY RUN] schema version {current} is up to date")
+        for version, description, _ in pending:
+            log(f"[DRY RUN] would apply migration {version}: {description}")
+        return current
+
+    for version, description, step in pending:
+        start = perf_counter()
+
+        step(conn, chunk_size)
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+        conn.commit()
+
+        log(f"[MIGRATION] {version}: {description} ({perf_counter() - start:.3f}s)")
+        current = version
+
+    return current
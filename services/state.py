@@ -1,14 +1,45 @@
 """
-script handles the list of global reactive values
+script handles the reactive values of one app session
+every session creates its own state in app.server and passes it to the page modules,
+so one user's navigation never re-renders or changes another session
+
+every key is its own reactive value, a reader only re-runs when the key it reads changes
 """
 
 from shiny import reactive
 
-state = reactive.Value({
-    "current_page": "user_selection",
-    "current_user": None,
-    "refresh_user": 0
-})
 
-def update_state(**kwargs):
-    state.set({**state(), **kwargs})
\ No newline at end of file
+class SessionState:
+    def __init__(self):
+        self._values = {
+            "current_page": reactive.Value("user_selection"),
+            "current_user": reactive.Value(None),
+            "refresh_user": reactive.Value(0), # changes when users were created or deleted
+            "refresh_data": reactive.Value(0) # changes when the current user wrote habits or checks
+        }
+
+    def get(self, key):
+        """
+        read one key, creates a reactive dependency on this key only
+
+        Parameters:
+        - key: string, name of the value (e.g. current_page)
+        """
+        return self._values[key]()
+
+    def update_state(self, **kwargs):
+        """
+        set one or more keys, only readers of the changed keys are invalidated
+        """
+        for key, value in kwargs.items():
+            self._values[key].set(value)
+
+    def bump(self, key):
+        """
+        increase a refresh counter by one, e.g. to re-render the user tiles or to reload the habits after a write
+
+        Parameters:
+        - key: string, name of the counter (refresh_user or refresh_data)
+        """
+        with reactive.isolate():
+            self._values[key].set(self._values[key]() + 1)
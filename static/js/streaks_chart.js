@@ -0,0 +1,104 @@
+/*
+Draws the streaks plot of the analytics screen in the browser
+The server sends every habit as its first day (days since 1970-01-01), the run-length encoded
+streaks of the following points and for weekly / monthly points the gaps between them
+(models/streak_history.py, streak_chart_json), the days are rebuilt here
+When Chart.js couldn't be loaded, the server is told to render the matplotlib image instead
+*/
+window.HabitCharts = (function () {
+    const DAY_MS = 24 * 60 * 60 * 1000;
+    const charts = {}; // canvas id -> chart, an old chart has to be destroyed before the canvas is reused
+
+    // [[value, count], ...] -> [value, value, ...]
+    function expand(runs) {
+        const values = [];
+        for (const [value, count] of runs) {
+            for (let i = 0; i < count; i++) {
+                values.push(value);
+            }
+        }
+        return values;
+    }
+
+    // first day, streak runs and gap runs -> [{x: day, y: value}, ...]
+    // without gaps the points are one day apart (daily resolution)
+    function expandRuns(start, runs, gaps) {
+        const gapValues = gaps ? expand(gaps) : null;
+        let day = start;
+        return expand(runs).map(function (value, i) {
+            if (i > 0) {
+                day += gapValues ? gapValues[i - 1] : 1;
+            }
+            return { x: day, y: value };
+        });
+    }
+
+    function formatDay(day) {
+        return new Date(day * DAY_MS).toISOString().slice(0, 10);
+    }
+
+    function fallback() {
+        if (window.Shiny && Shiny.setInputValue) {
+            Shiny.setInputValue("streaks_chart_unavailable", true, { priority: "event" });
+        }
+    }
+
+    function drawStreaks(canvasId, dataId) {
+        if (typeof window.Chart === "undefined") {
+            fallback();
+            return;
+        }
+
+        const canvas = document.getElementById(canvasId);
+        const data = document.getElementById(dataId);
+        if (!canvas || !data) {
+            return;
+        }
+
+        const payload = JSON.parse(data.textContent);
+        const datasets = payload.habits.map(function (h) {
+            return { label: h.name, data: expandRuns(h.start, h.runs, h.gaps), pointRadius: 2, tension: 0 };
+        });
+
+        if (charts[canvasId]) {
+            charts[canvasId].destroy();
+        }
+
+        if (!datasets.length) {
+            const ctx = canvas.getContext("2d");
+            ctx.textAlign = "center";
+            ctx.fillText("No streak data yet", canvas.width / 2, canvas.height / 2);
+            return;
+        }
+
+        charts[canvasId] = new Chart(canvas, {
+            type: "line",
+            data: { datasets: datasets },
+            options: {
+                animation: false,
+                maintainAspectRatio: false,
+                parsing: false,
+                interaction: { mode: "nearest", intersect: false },
+                scales: {
+                    x: {
+                        type: "linear",
+                        ticks: { stepSize: 1, maxTicksLimit: 8, callback: formatDay },
+                    },
+                    y: {
+                        beginAtZero: true,
+                        ticks: { precision: 0 },
+                    },
+                },
+                plugins: {
+                    tooltip: {
+                        callbacks: {
+                            title: function (items) { return items.length ? formatDay(items[0].parsed.x) : ""; },
+                        },
+                    },
+                },
+            },
+        });
+    }
+
+    return { drawStreaks: drawStreaks, expandRuns: expandRuns };
+})();
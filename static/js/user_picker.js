@@ -0,0 +1,8 @@
+/*
+Handles the clicks on the user tiles of the user selection screen
+One delegated handler for all tiles, so no handler or server effect has to be registered per user,
+the ID of the clicked user is sent to the server as the input select_user
+*/
+$(document).on("click", ".profile-card [data-user-id]", function () {
+    Shiny.setInputValue("select_user", Number(this.dataset.userId), { priority: "event" });
+});
@@ -154,6 +154,7 @@ def main():
             insert_df(conn, "activities", df_acts)
 
         print("All done.")
+        print("Run 'python -m services.maintenance rebuild-streaks' to update the stored streaks.")
     finally:
         conn.close()
 
@@ -5,6 +5,8 @@ import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from models.habit import Habit
+from models.streak_history import streak_history_df
+from models import streak_plot
 
 
 #-----------Methods from analytical module--------------
@@ -212,4 +214,19 @@ def test_dl_longest_for_habit():
     df = dl_longest_for_habit(rows, selected_habit="Read Book", equal_days=7, checks_map=checks_map)
     assert df.iloc[0]["HabitName"] == "Read Book"
     assert df.iloc[0]["EqualsToDays"] == 7
-    assert df.iloc[0]["record_streak"] == 3
\ No newline at end of file
+    assert df.iloc[0]["record_streak"] == 3
+
+
+def test_streaks_plot_is_deterministic_and_cached():
+    df = streak_history_df(rows, checks_map, until=date(2025, 8, 16))
+    key = streak_plot.plot_key(df, 600, 400, 1.0)
+
+    first = streak_plot.streaks_png(df, 600, 400, 1.0)
+    streak_plot.images.clear()
+    second = streak_plot.streaks_png(df, 600, 400, 1.0)
+
+    assert first == second and first.startswith("data:image/png;base64,")
+    assert streak_plot.images.get(key) == first
+    assert key != streak_plot.plot_key(df, 800, 400, 1.0)
+    assert key != streak_plot.plot_key(df.assign(streak=df["streak"] + 1), 600, 400, 1.0)
+
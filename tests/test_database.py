@@ -0,0 +1,625 @@
+import io
+import re
+import zipfile
+import pytest
+import threading
+import sqlite3
+import random
+from datetime import date, datetime, timedelta
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config import DB_PROFILES
+from services import database
+from services.connection_pool import ConnectionPool
+from services.migrations import MIGRATIONS, schema_version, run_migrations
+from models.habit import Habit
+from models.user import User
+from models.analytics_snapshot import AnalyticsSnapshot
+from services.cache import ResultCache, cached_for_user
+from services.export import zip_chunks, activities_parquet, habits_parquet, streak_history_parquet
+from models.streak_history import habit_series, streak_history_df
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # every test works on its own database file instead of services/habittracker.db
+    pool = ConnectionPool(tmp_path / "test.db", max_size=2, pragmas=DB_PROFILES["performance"])
+    monkeypatch.setattr(database, "_pool", pool)
+    pool.startup_settings = database.setup_database()
+    yield pool
+    pool.close_all()
+
+
+# ---------- connection pool ----------
+def test_pool_reuses_thread_connection(db):
+    user_id = database.new_user("Tester")
+    database.add_habit(user_id, "Read", "Daily", 1)
+    database.get_active_habits(user_id)
+
+    stats = database.pool_stats()
+    assert stats["size"] == 1
+    assert stats["misses"] == 1
+    assert stats["hits"] >= 3
+
+
+def test_pool_nested_borrow_shares_transaction(db):
+    with pytest.raises(RuntimeError):
+        with db.connection() as conn:
+            conn.execute("INSERT INTO user (Username) VALUES ('Nested')")
+            with db.connection() as inner:
+                assert inner is conn
+            raise RuntimeError("rollback")
+
+    assert not database.user_exists("Nested")
+
+
+def test_pool_is_bounded(db):
+    barrier = threading.Barrier(4)
+
+    def borrow():
+        # all four threads hold a connection at the same time
+        with db.connection():
+            barrier.wait()
+
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert db.stats()["size"] <= db.max_size
+    assert db.stats()["misses"] == 5 # setup_database + four threads
+
+
+def test_pool_never_evicts_acquired_connection(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db", max_size=1)
+    with pool.connection():
+        pass
+
+    # between acquiring the pooled connection and using it, another thread finds the pool full
+    conn, transient = pool._acquire(threading.get_ident())
+    def borrow():
+        with pool.connection():
+            pass
+
+    other = threading.Thread(target=borrow)
+    other.start()
+    other.join()
+
+    assert not transient
+    assert conn.execute("SELECT 1").fetchone()[0] == 1 # still open
+    assert pool.stats()["size"] == 1
+
+
+def test_performance_profile_applied(db):
+    settings = db.startup_settings
+    assert settings["journal_mode"] == "wal"
+    assert settings["synchronous"] == 1 # NORMAL
+    assert settings["temp_store"] == 2 # MEMORY
+    assert settings["busy_timeout"] == 5000
+
+
+def test_unknown_pragma_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ConnectionPool(tmp_path / "x.db", pragmas={"foreign_keys; DROP TABLE user": 1})
+
+
+# ---------- migrations ----------
+def test_new_database_has_latest_schema_version(db):
+    with db.connection() as conn:
+        assert schema_version(conn) == MIGRATIONS[-1][0]
+
+    # running the migrations again changes nothing
+    assert database.migrate() == MIGRATIONS[-1][0]
+
+
+def test_migration_dry_run_changes_nothing(tmp_path, monkeypatch, capsys):
+    pool = ConnectionPool(tmp_path / "new.db")
+    monkeypatch.setattr(database, "_pool", pool)
+
+    assert database.migrate(dry_run=True) == 0
+    assert "would apply migration 1" in capsys.readouterr().out
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+    pool.close_all()
+
+
+# ---------- day numbers ----------
+def test_activity_day_added_to_old_database(tmp_path, monkeypatch):
+    pool = ConnectionPool(tmp_path / "old.db")
+    with pool.connection() as conn:
+        # schema before the ActivityDay column
+        conn.execute("""
+            CREATE TABLE activities (
+                activityID INTEGER PRIMARY KEY AUTOINCREMENT,
+                habitID INTEGER NOT NULL,
+                ActivityDate TIMESTAMP,
+                UNIQUE(habitID, ActivityDate)
+            )
+        """)
+        conn.execute("INSERT INTO activities (habitID, ActivityDate) VALUES (1, '2025-08-16 23:59:00')")
+
+    monkeypatch.setattr(database, "_pool", pool)
+    monkeypatch.setattr(database, "DB_MIGRATION_CHUNK_SIZE", 1)
+    database.setup_database()
+
+    # populated for existing rows and kept in sync by the trigger for new ones
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO activities (habitID, ActivityDate) VALUES (1, '2025-08-17')")
+
+    assert list(database.get_checks_for_habits([1])[1]) == [Habit._to_day(date(2025, 8, 16)), Habit._to_day(date(2025, 8, 17))]
+    pool.close_all()
+
+
+def test_streak_state_migration_replays_checks(db):
+    user_id = database.new_user("Tester")
+    ids = [database.add_habit(user_id, f"Habit {i}", period, 1) for i, period in enumerate(["Daily", "Weekly", "12", "Daily"])]
+    for day in (1, 2, 3, 9, 10, 30):
+        database.mark_habits_as_checked(ids[:3], when=datetime(2025, 8, day, 9, 0, 0))
+    expected = database.get_streak_states(ids)
+
+    # an old database without the streak state runs migration 4 again, on its own connection
+    with db.connection() as conn:
+        conn.execute("DELETE FROM habit_streaks")
+        conn.execute("PRAGMA user_version = 3")
+    conn = sqlite3.connect(db.db_path)
+    run_migrations(conn, chunk_size=100, log=lambda line: None)
+    conn.close()
+
+    assert database.get_streak_states(ids) == expected
+    assert expected[ids[3]]["LastCheckDay"] is None
+
+
+# ---------- checks ----------
+def test_mark_habits_as_checked_single_transaction(db):
+    user_id = database.new_user("Tester")
+    ids = [database.add_habit(user_id, f"Habit {i}", "Daily", 1) for i in range(5)]
+
+    borrows = db.stats()["misses"] + db.stats()["hits"]
+    errors = database.mark_habits_as_checked(ids + [999], when=datetime(2025, 8, 16, 9, 0, 0))
+
+    assert errors == [(999, "Habit 999 not found")]
+    assert db.stats()["misses"] + db.stats()["hits"] == borrows + 1 # a single borrow, so a single commit
+
+    checks = database.get_checks_for_habits(ids)
+    assert all(list(checks[hid]) == [Habit._to_day(date(2025, 8, 16))] for hid in ids)
+    assert database.get_habit(ids[0])["LastChecked"] == "2025-08-16 09:00:00"
+
+
+def test_mark_habits_as_checked_reports_duplicates(db):
+    user_id = database.new_user("Tester")
+    hid = database.add_habit(user_id, "Read", "Daily", 1)
+    when = datetime(2025, 8, 16, 9, 0, 0)
+
+    assert database.mark_habits_as_checked([hid, hid], when=when) == []
+    errors = database.mark_habits_as_checked([hid], when=when)
+
+    assert len(errors) == 1 and errors[0][0] == hid
+    with pytest.raises(ValueError):
+        database.mark_habit_as_checked(999)
+
+
+def test_past_check_keeps_last_checked(db):
+    user_id = database.new_user("Tester")
+    hid = database.add_habit(user_id, "Read", "Daily", 1)
+
+    database.mark_habits_as_checked([hid], when=datetime(2025, 8, 16, 9, 0, 0))
+    database.mark_habits_as_checked([hid], when=datetime(2025, 8, 10, 9, 0, 0))
+
+    assert database.get_habit(hid)["LastChecked"] == "2025-08-16 09:00:00"
+
+
+# ---------- streak state ----------
+@pytest.mark.parametrize("period", ["Daily", "Weekly", "3"])
+def test_incremental_streak_state_matches_replay(db, period):
+    rng = random.Random(period)
+    user_id = database.new_user("Tester")
+    hid = database.add_habit(user_id, "Habit", period, 1)
+    equal_days = database.get_habit(hid)["EqualsToDays"]
+
+    day = date(2025, 1, 1)
+    checks = []
+    for _ in range(60):
+        day += timedelta(days=rng.choice([1, 1, 2, 3, 5, 8]))
+        checks.append(day)
+        database.mark_habits_as_checked([hid], when=datetime.combine(day, datetime.min.time()))
+
+    state = database.get_streak_states([hid])[hid]
+    assert state["BestStreak"] == Habit.highest_streak(checks, equal_days)
+    for today in (day, day + timedelta(days=equal_days - 1), day + timedelta(days=equal_days + 1)):
+        assert Habit.current_from_state(state, today) == Habit.current_streak(checks, equal_days, today)
+
+    # a full rebuild from the activities gives the same state
+    database.rebuild_streak_states([hid])
+    assert database.get_streak_states([hid])[hid] == state
+
+
+def test_check_in_the_past_replays_streak(db):
+    user_id = database.new_user("Tester")
+    hid = database.add_habit(user_id, "Read", "Daily", 1)
+
+    for day in (1, 2, 4):
+        database.mark_habits_as_checked([hid], when=datetime(2025, 8, day, 9, 0, 0))
+    assert database.get_streak_states([hid])[hid]["BestStreak"] == 2
+
+    database.mark_habits_as_checked([hid], when=datetime(2025, 8, 3, 9, 0, 0))
+    state = database.get_streak_states([hid])[hid]
+    assert (state["CurrentStreak"], state["BestStreak"]) == (4, 4)
+
+
+def test_expired_streak_kept_for_checks_in_the_past(db):
+    user_id = database.new_user("Tester")
+    hid = database.add_habit(user_id, "Read", "Weekly", 1)
+    database.mark_habits_as_checked([hid], when=datetime(2025, 8, 1, 9, 0, 0))
+
+    # the run is over when the state is read, but the stored state keeps it
+    assert Habit.ongoing_streaks_by_user(user_id) == {hid: 0}
+    state = database.get_streak_states([hid])[hid]
+    assert (state["CurrentStreak"], state["BestStreak"]) == (1, 1)
+    assert Habit.current_from_state(state, date(2025, 8, 7)) == 1
+    assert Habit.current_from_state(state, date(2025, 8, 8)) == 0
+
+    # a check entered later for a day within the period continues the run
+    database.mark_habits_as_checked([hid], when=datetime(2025, 8, 6, 9, 0, 0))
+    state = database.get_streak_states([hid])[hid]
+    assert (state["CurrentStreak"], state["BestStreak"]) == (2, 2)
+
+
+# ---------- analytics snapshot ----------
+def test_analytics_snapshot_matches_single_queries(db):
+    user_id = database.new_user("Tester")
+    other = database.new_user("Other")
+    ids = [database.add_habit(user_id, f"Habit {i}", period, active)
+           for i, (period, active) in enumerate([("Daily", 1), ("Weekly", 0), ("Daily", 1)])]
+    database.add_habit(other, "Not mine", "Daily", 1)
+
+    for day in (1, 2, 2, 5):
+        database.mark_habits_as_checked([ids[0], ids[1]], when=datetime(2025, 8, day, 9, day, 0))
+
+    borrows = db.stats()["misses"] + db.stats()["hits"]
+    snapshot = AnalyticsSnapshot.load(user_id)
+    assert db.stats()["misses"] + db.stats()["hits"] == borrows + 1
+
+    assert snapshot.habits == [h.to_dict() for h in Habit.full_list_by_user(user_id)]
+    assert snapshot.active() == [h.to_dict() for h in Habit.list_by_user(user_id)]
+    assert snapshot.archived() == [h.to_dict() for h in Habit.archived_list_by_user(user_id)]
+    assert snapshot.periods() == ["Daily"] and snapshot.periods(active_only=False) == ["Daily", "Weekly"]
+
+    checks = database.get_checks_for_habits(ids)
+    assert {hid: list(days) for hid, days in snapshot.checks.items()} == {hid: list(days) for hid, days in checks.items()}
+    assert snapshot.records == Habit.record_streaks(ids)
+    assert snapshot.check_count(ids[0]) == 3 and snapshot.check_count(ids[2]) == 0
+    assert snapshot.by_name("Habit 1")["habitID"] == ids[1]
+
+
+# ---------- result cache ----------
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_size=2)
+    cache.get_or_compute("a", lambda: 1)
+    cache.get_or_compute("b", lambda: 2)
+    assert cache.get_or_compute("a", lambda: None) == 1 # hit, a is the most recent entry now
+    cache.get_or_compute("c", lambda: 3) # evicts b
+
+    assert cache.get_or_compute("b", lambda: "new") == "new"
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 1, "misses": 4, "evictions": 2}
+
+
+def test_writes_increase_data_version(db):
+    user_id = database.new_user("Tester")
+    other = database.new_user("Other")
+    versions = [database.get_data_version(user_id)]
+
+    hid = database.add_habit(user_id, "Read", "Daily", 1)
+    versions.append(database.get_data_version(user_id))
+    database.mark_habit_as_checked(hid)
+    versions.append(database.get_data_version(user_id))
+    database.edit_habit(hid, "Read more", "Weekly", 1)
+    versions.append(database.get_data_version(user_id))
+    database.delete_habit(hid)
+    versions.append(database.get_data_version(user_id))
+
+    assert versions == sorted(set(versions)) # strictly increasing
+    assert database.get_data_version(other) == 0
+    assert database.get_data_version(999) is None
+
+
+def test_cached_results_invalidated_by_writes(db):
+    user_id = database.new_user("Tester")
+    hid = database.add_habit(user_id, "Read", "Daily", 1)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return Habit.ongoing_streaks_by_user(user_id)
+
+    assert cached_for_user("test", user_id, compute) == {hid: 0}
+    assert cached_for_user("test", user_id, compute) == {hid: 0}
+    assert len(calls) == 1
+
+    database.mark_habit_as_checked(hid)
+    assert cached_for_user("test", user_id, compute) == {hid: 1}
+    assert Habit.ongoing_streaks_by_user(user_id) == {hid: 1}
+    assert len(calls) == 2
+
+
+def test_cached_results_invalidated_by_streak_rebuild(db):
+    user_id = database.new_user("Tester")
+    other = database.new_user("Other")
+    hid = database.add_habit(user_id, "Read", "Daily", 1)
+    database.add_habit(other, "Walk", "Daily", 1)
+    database.mark_habit_as_checked(hid)
+
+    # drift in the stored state, e.g. written by another tool, is cached until the rebuild
+    with db.connection() as conn:
+        conn.execute("UPDATE habit_streaks SET CurrentStreak = 5, BestStreak = 5 WHERE habitID = ?", (hid,))
+    assert Habit.ongoing_streaks_by_user(user_id) == {hid: 5}
+
+    versions = database.get_data_version(user_id), database.get_data_version(other)
+    assert database.rebuild_streak_states([hid]) == 1
+    assert database.get_data_version(user_id) == versions[0] + 1
+    assert database.get_data_version(other) == versions[1]
+    assert Habit.ongoing_streaks_by_user(user_id) == {hid: 1}
+    assert Habit.record_streaks([hid]) == {hid: 1}
+
+
+def test_activity_log_is_read_in_chunks(db):
+    user_id = database.new_user("Tester")
+    ids = [database.add_habit(user_id, name, "Daily", 1) for name in ("Read", "Gym")]
+    other = database.add_habit(database.new_user("Other"), "Read", "Daily", 1)
+
+    for day in range(1, 6):
+        database.mark_habits_as_checked(ids + [other], when=datetime(2025, 8, day, 9, 0, 0))
+
+    chunks = list(database.iter_activity_log(user_id, chunk_size=2))
+    rows = [r for chunk in chunks for r in chunk]
+
+    assert max(len(c) for c in chunks) == 2
+    assert len(rows) == 10 and {r[1] for r in rows} == set(ids)
+    assert [r[3] for r in rows if r[1] == ids[0]] == [f"2025-08-0{day} 09:00:00" for day in range(1, 6)]
+    assert all(r[4] == Habit._to_day(r[3]) for r in rows)
+
+
+def test_parquet_exports_keep_types(db):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    user_id = database.new_user("Tester")
+    ids = [database.add_habit(user_id, name, "Daily", 1) for name in ("Read", "Gym")]
+    for day in (1, 2, 4):
+        database.mark_habits_as_checked(ids, when=datetime(2025, 8, day, 9, 0, 0))
+    snapshot = AnalyticsSnapshot.load(user_id)
+
+    activities = pq.read_table(io.BytesIO(activities_parquet(database.iter_activity_log(user_id, chunk_size=2))))
+    assert activities.num_rows == 6
+    assert str(activities.schema.field("date").type) == "date32[day]"
+    assert activities.column("date").to_pylist()[:3] == [date(2025, 8, 1), date(2025, 8, 2), date(2025, 8, 4)]
+
+    habits = pq.read_table(io.BytesIO(habits_parquet(snapshot))).to_pandas()
+    assert habits["check_count"].tolist() == [3, 3] and str(habits["Periodtype"].dtype) == "category"
+
+    history = pq.read_table(io.BytesIO(streak_history_parquet(habit_series(snapshot.habits, snapshot.checks, until=date(2025, 8, 5)))))
+    expected = streak_history_df(snapshot.habits, snapshot.checks, until=date(2025, 8, 5)).sort_values(["habitID", "date"])
+    assert history.column("streak").to_pylist() == expected["streak"].tolist()
+    assert str(history.schema.field("habitID").type) == "int32"
+
+    assert pq.read_table(io.BytesIO(activities_parquet(iter([])))).num_rows == 0
+
+
+def test_zip_bundle_contains_all_downloads(db):
+    user_id = database.new_user("Tester")
+    ids = [database.add_habit(user_id, name, period, active)
+           for name, period, active in [("Read", "Daily", 1), ("Gym", "Weekly", 1), ("Old", "Daily", 0)]]
+    for day in (1, 2, 3):
+        database.mark_habits_as_checked(ids, when=datetime(2025, 8, day, 9, 0, 0))
+
+    snapshot = AnalyticsSnapshot.load(user_id)
+    frames = snapshot.all_frames(period="Weekly")
+    data = b"".join(zip_chunks((name, df.to_csv(index=False).encode("utf-8")) for name, df in frames))
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None and len(archive.namelist()) == 6
+    assert archive.read("habits_by_periodicity.csv") == snapshot.periodicity_frame("Weekly").to_csv(index=False).encode("utf-8")
+    assert archive.read("longest_run_selected_habit.csv") == snapshot.longest_for_habit_frame("Gym").to_csv(index=False).encode("utf-8")
+    assert archive.read("longest_run_overall.csv").splitlines()[1] == f"{ids[1]},Gym,7,3".encode() # ties are sorted by name
+
+
+def test_habit_aggregates_counted_in_sql(db):
+    user_id = database.new_user("Tester")
+    hid, unchecked = (database.add_habit(user_id, name, "Daily", 1) for name in ("Read", "Gym"))
+    for day, hour in [(3, 9), (3, 18), (5, 9), (8, 9)]:
+        database.mark_habits_as_checked([hid], when=datetime(2025, 8, day, hour, 0, 0))
+
+    aggregates = database.get_habit_aggregates(user_id)
+
+    assert aggregates == {hid: {"check_count": 4, "active_days": 3, "first_check": date(2025, 8, 3), "last_check": date(2025, 8, 8)}}
+    assert database.get_user_habit_data(user_id)[1] == aggregates
+
+    snapshot = AnalyticsSnapshot.load(user_id)
+    assert snapshot.check_count(hid) == len(snapshot.checks[hid]) == 3 and snapshot.check_count(unchecked) == 0
+    assert snapshot.completions_frame().set_index("habitID").loc[hid, "last_check"] == date(2025, 8, 8)
+
+
+
+# ---------- user list ----------
+def test_users_are_paged_by_keyset(db):
+    names = ["anna", "Anton", "bert", "Berta", "carl", "Ann"] + [f"user{i:03d}" for i in range(40)]
+    for name in names:
+        database.new_user(name)
+
+    def pages(search):
+        key, result = None, []
+        while True:
+            page = User.page(search, after=key, limit=7)
+            result.append(page)
+            if len(page) < 7:
+                return result
+            key = page[-1].page_key
+
+    # all users in case-insensitive order, every user exactly once
+    everyone = [u.username for page in pages("") for u in page]
+    assert everyone == sorted(names, key=str.lower)
+
+    assert [u.username for page in pages("an") for u in page] == ["Ann", "anna", "Anton"]
+    assert [u.username for page in pages("USER00") for u in page] == [f"user{i:03d}" for i in range(10)]
+    assert User.page("zz") == []
+
+    user = User.page("bert")[0]
+    assert User.get(user.user_id).username == "bert" and User.get(-1) is None
+
+    # the page starts in the username index, it doesn't scan the users before it
+    with db.connection() as conn:
+        statements = []
+        conn.set_trace_callback(statements.append) # the statements with their bound values
+        User.page("b", after=user.page_key, limit=7)
+        conn.set_trace_callback(None)
+
+        plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + statements[-1]))
+    assert "idx_user_name_nocase" in plan and "TEMP B-TREE" not in plan
+
+
+# ---------- habit table ----------
+def test_habits_page_filters_and_sorts_in_sql(db):
+    user_id = database.new_user("Tester")
+    other = database.new_user("Other")
+    for i in range(12):
+        database.add_habit(user_id, f"Habit {i:02d}", "Daily" if i % 2 else "10", i % 3 != 0)
+    database.add_habit(user_id, "100%_done", "Weekly", 1)
+    database.add_habit(other, "Habit 99", "Daily", 1)
+
+    rows, total = database.get_habits_page(user_id, sort="name", limit=5)
+    assert total == 13 and [r["HabitName"] for r in rows] == ["100%_done", "Habit 00", "Habit 01", "Habit 02", "Habit 03"]
+    assert set(rows[0]) == {"habitID", "userID", "HabitName", "periodtypeID", "DateCreated", "LastChecked", "IsActive", "Periodtype", "EqualsToDays"}
+
+    rows, total = database.get_habits_page(user_id, sort="name", descending=True, offset=10, limit=5)
+    assert total == 13 and [r["HabitName"] for r in rows] == ["Habit 01", "Habit 00", "100%_done"]
+
+    # wildcards in the search are matched literally
+    rows, total = database.get_habits_page(user_id, search="0%_", limit=5)
+    assert total == 1 and rows[0]["HabitName"] == "100%_done"
+
+    rows, total = database.get_habits_page(user_id, search="habit", period="Custom", is_active=0, sort="name")
+    assert [r["HabitName"] for r in rows] == ["Habit 00", "Habit 06"] and total == 2
+    assert all(r["Periodtype"] == "every 10 days" for r in rows)
+
+    rows, total = database.get_habits_page(user_id, period="Weekly")
+    assert [r["HabitName"] for r in rows] == ["100%_done"]
+
+    assert database.get_habits_page(user_id, offset=20) == ([], 0)
+    with pytest.raises(ValueError):
+        database.get_habits_page(user_id, sort="HabitName; DROP TABLE habits")
+
+
+def test_habits_with_checks_listed_in_one_query(db):
+    user_id = database.new_user("Tester")
+    ids = [database.add_habit(user_id, name, "Daily", 1) for name in ("Read", "Gym", "Walk")]
+    database.edit_habit(ids[1], habit_name="Gym", period_str="Weekly", is_active=0)
+    database.add_habit(database.new_user("Other"), "Read", "Daily", 1)
+    for day, hour in [(3, 9), (3, 18), (1, 9), (8, 9)]:
+        database.mark_habits_as_checked(ids[:2], when=datetime(2025, 8, day, hour, 0, 0))
+
+    with db.connection() as conn:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        habits = Habit.full_list_by_user(user_id, with_checks=True)
+        conn.set_trace_callback(None)
+
+    assert len(statements) == 1
+    assert [h.habit_name for h in habits] == ["Read", "Walk", "Gym"] # active habits first
+    checks = database.get_checks_for_habits(ids)
+    assert all(list(h.check_days) == list(checks[h.habit_id]) for h in habits)
+    assert list(habits[0].check_days) == [Habit._to_day(date(2025, 8, d)) for d in (1, 3, 8)]
+
+    assert [h.habit_name for h in Habit.list_by_user(user_id)] == ["Read", "Walk"]
+    assert [h.habit_name for h in Habit.archived_list_by_user(user_id)] == ["Gym"]
+    assert Habit.list_by_user(user_id)[0].check_days is None
+
+    rows = database.get_habits(user_id, status="active", columns=("habitID", "BestStreak"))
+    assert rows == [{"habitID": ids[0], "BestStreak": 1}, {"habitID": ids[2], "BestStreak": 0}]
+
+    with pytest.raises(ValueError):
+        database.get_habits(user_id, columns=("habitID", "1; DROP TABLE habits"))
+
+
+def test_periodtypes_cached_and_written_with_the_habit(db):
+    user_id = database.new_user("Tester")
+    database.add_habit(user_id, "Read", "Daily", 1)
+
+    # a known period is taken from the cache, saving the habit is a single statement
+    with db.connection() as conn:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        hid = database.add_habit(user_id, "Gym", "Daily", 1)
+        database.edit_habit(hid, habit_name="Gym", period_str="Daily", is_active=0)
+        conn.set_trace_callback(None)
+
+    assert not any("FROM periodtypes" in s or "INTO periodtypes" in s for s in statements)
+    assert len({s for s in statements if s.lstrip().startswith("INSERT")}) == 1 # triggers repeat the statement in the trace
+
+    # a new period which is rolled back with the habit doesn't stay in the cache
+    with pytest.raises(sqlite3.IntegrityError):
+        database.add_habit(user_id, "Read", "12", 1)
+    with db.connection() as conn:
+        assert database.periodtypes.get_id(conn, "every 12 days") is None
+        assert conn.execute("SELECT COUNT(*) FROM periodtypes WHERE Periodtype = 'every 12 days'").fetchone()[0] == 0
+
+    hid = database.add_habit(user_id, "Walk", "12", 1)
+    habit = database.get_habit(hid)
+    with db.connection() as conn:
+        assert database.periodtypes.get_id(conn, "every 12 days") == habit["periodtypeID"]
+        assert database.periodtypes.days(conn, habit["periodtypeID"]) == 12
+
+
+def test_checks_for_many_habits_reuse_statement_shapes(db, monkeypatch):
+    user_id = database.new_user("Tester")
+    ids = [database.add_habit(user_id, f"Habit {i}", "Daily", 1) for i in range(600)]
+    database.mark_habits_as_checked(ids[::7], when=datetime(2025, 8, 16, 9))
+    database.mark_habits_as_checked(ids[::3], when=datetime(2025, 8, 17, 9))
+    day = Habit._to_day(date(2025, 8, 16))
+
+    with db.connection() as conn:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        for n in (1, 5, 8, 9, 70, 513, 600):
+            checks = database.get_checks_for_habits(ids[-n:][::-1])
+            assert list(checks) == ids[-n:][::-1] # keyed in the order of the request
+        conn.set_trace_callback(None)
+
+    # the trace shows the bound values, put the placeholders back to compare the prepared statement texts
+    shapes = {re.sub(r"\b(\d+|NULL)\b", "?", s) for s in statements}
+    assert len(shapes) == len(database.DB_ID_LIST_SIZES)
+    for i, hid in enumerate(ids):
+        expected = ([day] if i % 7 == 0 else []) + ([day + 1] if i % 3 == 0 else [])
+        assert list(checks[hid]) == expected
+
+    # far more ids than sqlite variables, unknown ids just get no checks
+    monkeypatch.setattr(database, "DB_ID_TEMP_TABLE_THRESHOLD", 1000)
+    many = list(range(ids[-1] + 40_000, 0, -1))
+    checks = database.get_checks_for_habits(many)
+    assert len(checks) == len(many)
+    assert all(list(checks[hid]) == list(database.get_checks_for_habits([hid])[hid]) for hid in ids[:50])
+    assert database.get_streak_states(many)[ids[0]]["BestStreak"] == 2
+    assert database.rebuild_streak_states(many) == len(ids)
+
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM temp.id_list").fetchone()[0] == 0
+
+
+def test_periodtype_written_by_another_connection_is_reused(db):
+    user_id = database.new_user("Tester")
+    database.add_habit(user_id, "Read", "Daily", 1) # loads the periodtype cache
+
+    other = sqlite3.connect(db.db_path)
+    other.execute("INSERT INTO periodtypes (Periodtype, EqualsToDays) VALUES ('every 9 days', 9)")
+    other.commit()
+    periodtype_id = other.execute("SELECT periodtypeID FROM periodtypes WHERE Periodtype = 'every 9 days'").fetchone()[0]
+    other.close()
+
+    hid = database.add_habit(user_id, "Walk", "9", 1)
+    database.edit_habit(hid, habit_name="Walk", period_str="9", is_active=1)
+
+    assert database.get_habit(hid)["periodtypeID"] == periodtype_id
+    with db.connection() as conn:
+        assert database.periodtypes.get_id(conn, "every 9 days") == periodtype_id
+        assert database.periodtypes.days(conn, periodtype_id) == 9
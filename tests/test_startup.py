@@ -0,0 +1,39 @@
+import json
+import subprocess
+
+import sys, os
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORT_BUDGET = 1.0 # seconds for importing app.py, without the lazy imports it took about 3x longer
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "pyarrow"]
+
+# imports app.py in a fresh interpreter on a temporary database file and reports the time and the loaded modules
+IMPORT_SCRIPT = """
+import json, sys, time
+import config
+config.DB_PATH = sys.argv[1]
+
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+
+print(json.dumps({"elapsed": elapsed, "modules": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def _import_app(db_path):
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT, str(db_path)] + HEAVY_MODULES,
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_app_startup_skips_heavy_libraries(tmp_path):
+    first = _import_app(tmp_path / "startup.db") # creates the database
+    assert first["modules"] == []
+
+    # best of three runs, the first run of an interpreter also fills the bytecode cache
+    elapsed = min(_import_app(tmp_path / "startup.db")["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET
+
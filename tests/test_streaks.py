@@ -1,4 +1,6 @@
 import pytest
+import random
+import numpy as np
 import pandas as pd
 from datetime import date, timedelta
 from pandas.testing import assert_frame_equal
@@ -7,6 +9,9 @@ import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from models.habit import Habit
+import json
+from models.streak_history import streak_series, streak_history_df, iter_streak_history, streak_chart_json, run_lengths, expand_runs, history_span
+from services.export import csv_chunks
 
 # sample data
 @pytest.mark.parametrize(
@@ -124,4 +129,176 @@ def test_meditate():
         {"date": pd.to_datetime("2025-08-11"), "habitID": 1, "HabitName": "Meditate", "streak": 4}
     ])
 
-    assert_frame_equal(df.reset_index(drop=True), expected.reset_index(drop=True))
\ No newline at end of file
+    assert_frame_equal(df.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def highest_streak_reference(check_dates, equal_days):
+    # the former quadratic implementation, kept to verify the single-pass version
+    days = sorted({Habit._to_date(d) for d in check_dates if Habit._to_date(d) is not None})
+
+    if not days:
+        return 0
+
+    best = 0
+    n = len(days)
+
+    for k in range(n):
+        end = days[k]
+        cnt = 0
+        j = k
+
+        while j >= 0:
+            window_start = end - timedelta(days=equal_days - 1)
+
+            if days[j] < window_start:
+                break
+
+            cnt += 1
+            end = days[j] - timedelta(days=1)
+            j -= 1
+
+            while j >= 0 and days[j] > end:
+                j -= 1
+
+        if cnt > best:
+            best = cnt
+
+    return best
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_highest_streak_matches_reference(seed):
+    rng = random.Random(seed)
+    equal_days = rng.choice([0, 1, 2, 7, 10, 30])
+    start = date(2023, 1, 1)
+
+    # random check days with clusters and gaps, including duplicates and iso strings
+    checks = []
+    day = start
+    for _ in range(rng.randint(0, 120)):
+        day += timedelta(days=rng.choice([0, 1, 1, 2, 3, 7, 8, 11, 31]))
+        checks.append(day.isoformat() if rng.random() < 0.3 else day)
+
+    assert Habit.highest_streak(checks, equal_days) == highest_streak_reference(checks, equal_days)
+
+
+def test_highest_streak_run_dates():
+    checks = [date(2025,7,1), date(2025,7,2), date(2025,7,10), date(2025,7,11), date(2025,7,12), date(2025,7,20)]
+
+    assert Habit.highest_streak_run(checks, 1) == (3, date(2025,7,10), date(2025,7,12))
+    assert Habit.highest_streak_run(checks, 8) == (6, date(2025,7,1), date(2025,7,20))
+    assert Habit.highest_streak_run([], 1) == (0, None, None)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_streak_series_matches_current_streak(seed):
+    rng = random.Random(seed)
+    equal_days = rng.choice([1, 2, 7, 10, 30])
+    start = date(2024, 1, 1)
+
+    checks = sorted({start + timedelta(days=rng.randint(0, 200)) for _ in range(rng.randint(0, 80))})
+    end = start + timedelta(days=220)
+
+    dates, streaks = streak_series(checks, equal_days, start, end)
+
+    expected = [
+        Habit.current_streak(check_dates=checks, equal_days=equal_days, today=start + timedelta(days=i))
+        for i in range((end - start).days + 1)
+    ]
+    assert dates[0] == pd.Timestamp(start).to_datetime64().astype("datetime64[D]")
+    assert streaks.tolist() == expected
+
+
+def test_streak_history_df_meditate():
+    rows = [{"habitID": 1, "HabitName": "Meditate", "EqualsToDays": 10}]
+    checks_map = {1: ["2025-07-18", "2025-07-26", "2025-08-05", "2025-08-11"]}
+
+    df = streak_history_df(rows, checks_map, since=date(2025,2,12), until=date(2025,8,11))
+    expected = build_streak_history(10, [dict(rows[0], DateCreated="2025-07-01")], date(2025,8,11), checks_map[1])
+
+    assert_frame_equal(df.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_streamed_streak_history_matches_dataframe():
+    rows = [{"habitID": 1, "HabitName": "Meditate", "EqualsToDays": 10},
+            {"habitID": 2, "HabitName": "Gym", "EqualsToDays": 2},
+            {"habitID": 3, "HabitName": "Never", "EqualsToDays": 1}]
+    checks_map = {1: ["2025-07-18", "2025-07-26", "2025-08-05", "2025-08-11"], 2: ["2025-08-01", "2025-08-02", "2025-08-06"]}
+
+    df = streak_history_df(rows, checks_map, until=date(2025, 8, 11))
+    streamed = b"".join(csv_chunks(list(df.columns), iter_streak_history(rows, checks_map, until=date(2025, 8, 11))))
+
+    expected = df.sort_values(["habitID", "date"]).to_csv(index=False, date_format="%Y-%m-%d").encode("utf-8")
+    assert streamed == expected
+
+
+
+def test_chart_json_decodes_to_streak_history():
+    rows = [{"habitID": 1, "HabitName": "Meditate", "EqualsToDays": 10},
+            {"habitID": 2, "HabitName": "Gym </script>", "EqualsToDays": 2},
+            {"habitID": 3, "HabitName": "Never", "EqualsToDays": 1}]
+    checks_map = {1: ["2025-07-18", "2025-07-26", "2025-08-05", "2025-08-11"], 2: ["2025-08-01", "2025-08-02", "2025-08-06"]}
+    until = date(2025, 8, 11)
+
+    text = streak_chart_json(rows, checks_map, until=until)
+    assert "</" not in text
+
+    df = streak_history_df(rows, checks_map, until=until)
+    payload = json.loads(text)
+    assert [h["name"] for h in payload["habits"]] == ["Gym </script>", "Meditate"]
+
+    for h in payload["habits"]:
+        expected = df[df["habitID"] == h["id"]]
+        streaks = expand_runs(h["runs"])
+        assert streaks.tolist() == expected["streak"].tolist()
+        assert date(1970, 1, 1) + timedelta(days=h["start"]) == expected["date"].iloc[0].date()
+        # flat parts of the series are sent as one pair
+        assert len(h["runs"]) < len(streaks)
+
+    assert run_lengths([]) == []
+    assert run_lengths([0, 0, 1, 1, 1, 0]) == [[0, 2], [1, 3], [0, 1]]
+
+
+def test_long_history_is_downsampled_per_bucket():
+    rows = [{"habitID": 1, "HabitName": "Meditate", "EqualsToDays": 1}]
+    rng = random.Random(3)
+    start = date(2021, 1, 1)
+    checks_map = {1: [start + timedelta(days=i) for i in range(1500) if rng.random() < 0.8]}
+    until = date(2025, 2, 9)
+
+    daily = streak_history_df(rows, checks_map, until=until)
+    daily["week"] = daily["date"].dt.to_period("W-SUN")
+    daily["month"] = daily["date"].dt.to_period("M")
+
+    for bucket, column in [("week", "week"), ("month", "month")]:
+        df = streak_history_df(rows, checks_map, until=until, bucket=bucket)
+        grouped = daily.groupby(column)
+
+        # one point per bucket, dated on its last day, the last point is still the last day of the history
+        assert df["date"].tolist() == grouped["date"].max().tolist()
+        assert df["streak"].tolist() == grouped["streak"].max().tolist()
+        assert df["date"].iloc[-1] == pd.Timestamp(until)
+
+        last = streak_history_df(rows, checks_map, until=until, bucket=bucket, how="last")
+        assert last["streak"].tolist() == grouped["streak"].last().tolist()
+
+    # all-time history of four years stays bounded
+    since, bucket = history_span("all", until)
+    assert since is None and bucket == "month"
+    assert len(streak_history_df(rows, checks_map, until=until, bucket=bucket)) == 50
+
+    since, bucket = history_span("90d", until)
+    assert len(streak_history_df(rows, checks_map, since=since, until=until, bucket=bucket)) == 90
+
+
+def test_chart_json_sends_gaps_of_buckets():
+    rows = [{"habitID": 1, "HabitName": "Gym", "EqualsToDays": 7}]
+    checks_map = {1: ["2025-06-04", "2025-06-10", "2025-06-20", "2025-07-02"]}
+    until = date(2025, 7, 16)
+
+    df = streak_history_df(rows, checks_map, until=until, bucket="week")
+    habit = json.loads(streak_chart_json(rows, checks_map, until=until, bucket="week"))["habits"][0]
+
+    days = habit["start"] + np.concatenate(([0], np.cumsum(expand_runs(habit["gaps"]))))
+    assert [date(1970, 1, 1) + timedelta(days=int(d)) for d in days] == [d.date() for d in df["date"]]
+    assert expand_runs(habit["runs"]).tolist() == df["streak"].tolist()